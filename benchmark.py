@@ -0,0 +1,296 @@
+import argparse
+import functools
+import gzip
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+import wiki_crawl
+
+BENCHMARK_ENGINES = ['bytes', 'pandas', 'pandas-whole', 'disk', 'disk-chunked']
+DOMAIN_CODES = ['en', 'en.m', 'de', 'de.m', 'fr', 'fr.m', 'ja', 'es', 'ru', 'commons.m', 'www.wd']
+DOMAIN_WEIGHTS = [0.30, 0.28, 0.06, 0.06, 0.05, 0.05, 0.05, 0.05, 0.04, 0.03, 0.03]
+GENERATE_BATCH_LINES = 200_000
+
+def title_names(title_count: int) -> list:
+    return ['Main_Page'] + [f'Page_{rank}' for rank in range(1, title_count)]
+
+def generate_dump(path: str, line_count: int, title_count: int = 100_000, malformed_rate: float = 0.001,
+                  zipf_exponent: float = 1.2, seed: int = 0, member_lines: Optional[int] = None) -> None:
+    # Titles follow a Zipf distribution over popularity rank, like real traffic, and a small share of
+    # lines is malformed the ways real dumps are: missing fields, extra fields, non-numeric counts.
+    # With member_lines, every that many lines start a new gzip member, like a block-compressed file.
+    rng = np.random.default_rng(seed)
+    titles = title_names(title_count)
+    batch_lines = min(member_lines or GENERATE_BATCH_LINES, GENERATE_BATCH_LINES)
+    with open(path, 'wb') as raw_file:
+        dump_file = raw_file if member_lines else gzip.GzipFile(fileobj=raw_file, mode='wb', compresslevel=6)
+        for start in range(0, line_count, batch_lines):
+            size = min(batch_lines, line_count - start)
+            ranks = (rng.zipf(zipf_exponent, size) - 1) % title_count
+            domains = rng.choice(len(DOMAIN_CODES), size, p=DOMAIN_WEIGHTS)
+            counts = rng.geometric(0.3, size)
+            malformed = rng.random(size) < malformed_rate
+            lines = []
+            for rank, domain, count, broken in zip(ranks, domains, counts, malformed):
+                line = f'{DOMAIN_CODES[domain]} {titles[rank]} {count} 0'
+                if broken:
+                    line = [f'{DOMAIN_CODES[domain]} {titles[rank]}', f'{DOMAIN_CODES[domain]} {titles[rank]} n/a 0',
+                            f'{line} extra'][rank % 3]
+                lines.append(line)
+            text = ('\n'.join(lines) + '\n').encode('utf-8')
+            dump_file.write(gzip.compress(text, compresslevel=6) if member_lines else text)
+        dump_file.close()
+
+def generate_dumps_directory(root: str, hours: int, line_count: int, title_count: int, malformed_rate: float,
+                             start: datetime = datetime(2023, 1, 1)) -> list:
+    # Lays the files out like dumps.wikimedia.org/other/pageviews/YYYY/YYYY-MM/
+    links = []
+    for offset in range(hours):
+        hour = start + timedelta(hours=offset)
+        month_dir = os.path.join(root, f'{hour:%Y}', f'{hour:%Y-%m}')
+        os.makedirs(month_dir, exist_ok=True)
+        filename = f'pageviews-{hour:%Y%m%d-%H}0000.gz'
+        generate_dump(os.path.join(month_dir, filename), line_count, title_count, malformed_rate, seed=offset)
+        links.append(f'{hour:%Y}/{hour:%Y-%m}/{filename}')
+    return links
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_dumps_server(root: str) -> tuple:
+    handler = functools.partial(QuietHandler, directory=root)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+def peak_rss_mb() -> float:
+    # VmHWM belongs to this address space alone; ru_maxrss carries over the parent's peak across fork/exec
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Kilobytes on Linux
+
+def measure_scan(path: str, search_terms: list, engine: str,
+                 pandas_memory_mb: float = wiki_crawl.DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    with open(path, 'rb') as dump_file:
+        data = dump_file.read()
+    started = time.perf_counter()
+    decompressed_bytes = 0
+    line_count = 0
+    for block in wiki_crawl.iter_gzip_blocks(wiki_crawl.split_chunks(data)):
+        decompressed_bytes += len(block)
+        line_count += block.count(b'\n')
+    decompress_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if engine.startswith('disk'):
+        # The original download_and_process_file path: unzip to a text file, then search it with pandas,
+        # reading the whole file at once ('disk') or in memory-bounded chunks ('disk-chunked')
+        text_file = wiki_crawl.unzip_file(path)
+        for term in search_terms:
+            wiki_crawl.search_file(text_file, term, 0, pandas_memory_mb if engine == 'disk-chunked' else None)
+        os.remove(text_file)
+    elif engine.startswith('pandas'):
+        blocks = wiki_crawl.iter_gzip_blocks(wiki_crawl.split_chunks(data))
+        wiki_crawl.count_terms_with_pandas(blocks, search_terms, max_memory_mb=pandas_memory_mb if engine == 'pandas' else None)
+    else:
+        wiki_crawl.scan_hour_data(data, tuple(search_terms), engine)
+    seconds = time.perf_counter() - started
+    return {
+        'engine': engine,
+        'lines': line_count,
+        'seconds': round(seconds, 3),
+        'lines_per_second': round(line_count / seconds),
+        'mb_per_second': round(decompressed_bytes / 1024 ** 2 / seconds, 1),
+        'decompress_mb_per_second': round(decompressed_bytes / 1024 ** 2 / decompress_seconds, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def measure_match(paths: list, search_terms: list, match: str, memo_entries: int) -> dict:
+    # Hour files scanned one after another in one process, as a scan worker does, so later hours show
+    # what the matcher's memo carries over. A memo smaller than an hour's distinct titles stands in for
+    # a real hour file, whose titles outnumber TITLE_MEMO_MAX_ENTRIES.
+    wiki_crawl.TITLE_MEMO_MAX_ENTRIES = memo_entries
+    terms = tuple(search_terms if match == 'exact' else [term.replace('_', ' ') for term in search_terms])
+    hour_seconds = []
+    for path in paths:
+        with open(path, 'rb') as dump_file:
+            data = dump_file.read()
+        started = time.perf_counter()
+        wiki_crawl.scan_hour_data(data, terms, match=match)
+        hour_seconds.append(time.perf_counter() - started)
+    later_seconds = hour_seconds[1:] or hour_seconds
+    return {
+        'match': match,
+        'terms': len(terms),
+        'memo_entries': memo_entries,
+        'first_hour_seconds': round(hour_seconds[0], 3),
+        'later_hour_seconds': round(sum(later_seconds) / len(later_seconds), 3),
+    }
+
+def measure_inflate(path: str, workers: int) -> dict:
+    # Decompression alone. Per core divides by the CPU time of all inflate threads, so it stays flat
+    # while the wall-clock rate grows with the workers, as long as the file has members to split on.
+    with open(path, 'rb') as dump_file:
+        data = dump_file.read()
+    segments = [0] if workers < 2 else wiki_crawl.gzip_member_offsets(
+        data, max(workers, len(data) // wiki_crawl.PARALLEL_INFLATE_SEGMENT_BYTES))
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    decompressed_bytes = sum(len(block) for block in wiki_crawl.iter_dump_blocks(wiki_crawl.split_chunks(data), workers))
+    seconds = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_started
+    return {
+        'backend': wiki_crawl.fast_zlib.__name__,
+        'workers': workers,
+        'segments': len(segments),
+        'seconds': round(seconds, 3),
+        'mb_per_second': round(decompressed_bytes / 1024 ** 2 / seconds, 1),
+        'mb_per_second_per_core': round(decompressed_bytes / 1024 ** 2 / cpu_seconds, 1),
+    }
+
+def measure_end_to_end(links: list, base_url: str, search_terms: list, fetch_workers: int, scan_workers: int,
+                       engine: str = 'bytes', pandas_memory_mb: float = wiki_crawl.DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    # pandas-whole is the pandas engine without a chunk memory ceiling
+    scan_engine = 'pandas' if engine.startswith('pandas') else engine
+    client = wiki_crawl.DownloadClient(max_connections=max(fetch_workers, 1))
+    started = time.perf_counter()
+    wiki_crawl.run_pipeline(links, base_url, search_terms, fetch_workers, scan_workers, client=client, engine=scan_engine,
+                            max_memory_mb=None if engine == 'pandas-whole' else pandas_memory_mb)
+    seconds = time.perf_counter() - started
+    client.close()
+    return {
+        'engine': engine,
+        'fetch_workers': fetch_workers,
+        'scan_workers': scan_workers,
+        'hours': len(links),
+        'seconds': round(seconds, 3),
+        'hours_per_minute': round(len(links) / seconds * 60, 1),
+        'download_mb_per_second': round(client.bytes_downloaded / 1024 ** 2 / seconds, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def run_and_report(queue, function, args: tuple) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    queue.put(function(*args))
+
+def run_isolated(function, *args) -> dict:
+    # A fresh interpreter per measurement, so peak RSS belongs to that measurement alone. A plain Process
+    # rather than a Pool, because pool workers are daemonic and the pipeline starts its own scan processes.
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_and_report, args=(queue, function, args))
+    process.start()
+    try:
+        return queue.get()
+    finally:
+        process.join()
+
+def print_table(rows: list) -> None:
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+    print()
+
+def parse_concurrency(value: str) -> tuple:
+    fetch_workers, scan_workers = value.lower().split('x')
+    return int(fetch_workers), int(scan_workers)
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark scan engines and the download pipeline on synthetic pageview dumps.')
+    parser.add_argument('--lines', type=int, default=1_000_000, help='Lines per synthetic hour file (real ones have 50-100M).')
+    parser.add_argument('--hours', type=int, default=4, help='Hour files served for the end-to-end runs.')
+    parser.add_argument('--titles', type=int, default=200_000, help='Distinct page titles.')
+    parser.add_argument('--malformed-rate', type=float, default=0.001, help='Share of malformed lines.')
+    parser.add_argument('--terms', type=int, default=5, help='Number of titles to search for.')
+    parser.add_argument('--engines', nargs='+', default=BENCHMARK_ENGINES, choices=BENCHMARK_ENGINES,
+                        help='pandas and disk-chunked read in chunks of --pandas-memory-mb, pandas-whole and disk all at once.')
+    parser.add_argument('--pandas-memory-mb', type=float, default=wiki_crawl.DEFAULT_PANDAS_MEMORY_MB,
+                        help='Chunk memory ceiling for the chunked pandas engines.')
+    parser.add_argument('--match-modes', nargs='*', default=list(wiki_crawl.MATCH_MODES), choices=wiki_crawl.MATCH_MODES,
+                        help='Title match modes for the matching runs, which scan every hour file in one process.')
+    parser.add_argument('--match-terms', type=int, default=1000, help='Number of titles to search for in the matching runs.')
+    parser.add_argument('--memo-entries', type=int, default=10_000,
+                        help='Title memo size for the matching runs; keep it below --titles to outgrow it like a real hour.')
+    parser.add_argument('--inflate-workers', nargs='*', type=int, default=[1, 2, 4], metavar='N',
+                        help='Thread counts for the decompression runs.')
+    parser.add_argument('--member-lines', type=int, default=100_000,
+                        help='Lines per gzip member of the multi-member file the decompression runs read.')
+    parser.add_argument('--concurrency', nargs='*', default=['1x0', '2x0', '2x2', '3x4'], type=parse_concurrency,
+                        metavar='FETCHxSCAN', help='Fetch/scan worker settings for the end-to-end runs.')
+    parser.add_argument('--work-dir', help='Keep the generated dumps here instead of a temporary directory.')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON.')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[list] = None) -> dict:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    root = args.work_dir or tempfile.mkdtemp(prefix='wiki_bench_')
+    try:
+        print(f'Generating {args.hours} hour file(s) of {args.lines} lines in {root} ...')
+        links = generate_dumps_directory(root, max(args.hours, 1), args.lines, args.titles, args.malformed_rate)
+        # Spread the search over popular, mid-ranked and rare titles
+        titles = title_names(args.titles)
+        search_terms = [titles[int(rank)] for rank in np.geomspace(1, args.titles - 1, args.terms)]
+
+        first_dump = os.path.join(root, links[0])
+        scan_rows = [run_isolated(measure_scan, first_dump, search_terms, engine, args.pandas_memory_mb)
+                     for engine in args.engines]
+        print_table(scan_rows)
+
+        match_terms = [titles[int(rank)] for rank in np.linspace(1, args.titles - 1, args.match_terms)]
+        hour_dumps = [os.path.join(root, link) for link in links]
+        match_rows = [run_isolated(measure_match, hour_dumps, match_terms, match, args.memo_entries)
+                      for match in args.match_modes]
+        print_table(match_rows)
+
+        members_dump = os.path.join(root, 'members.gz')
+        generate_dump(members_dump, args.lines, args.titles, args.malformed_rate, member_lines=args.member_lines)
+        inflate_rows = [run_isolated(measure_inflate, path, workers)
+                        for path in (first_dump, members_dump) for workers in args.inflate_workers]
+        print_table(inflate_rows)
+
+        server, base_url = start_dumps_server(root)
+        try:
+            # The pipeline scans hour files in memory, so the unzip-to-disk engines have no end-to-end run
+            end_to_end_rows = [run_isolated(measure_end_to_end, links[:args.hours], base_url, search_terms,
+                                            fetch_workers, scan_workers, engine, args.pandas_memory_mb)
+                               for engine in args.engines if not engine.startswith('disk')
+                               for fetch_workers, scan_workers in args.concurrency]
+        finally:
+            server.shutdown()
+        print_table(end_to_end_rows)
+
+        results = {'lines_per_hour_file': args.lines, 'scan': scan_rows, 'match': match_rows, 'inflate': inflate_rows,
+                   'end_to_end': end_to_end_rows}
+        if args.json:
+            with open(args.json, 'w') as json_file:
+                json.dump(results, json_file, indent=2)
+        return results
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
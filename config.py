@@ -8,3 +8,9 @@ DATABASE_CONFIG = {
 }
 
 WIKIPEDIA_BASE_URL = 'https://dumps.wikimedia.org/other/pageviews/'
+
+# Where results are stored: 'mysql', 'sqlite', 'csv' or 'parquet'
+STORAGE_BACKEND = 'mysql'
+
+# Per-day pageview-complete dumps, read instead of hour files when hourly resolution is not needed
+WIKIPEDIA_DAILY_BASE_URL = 'https://dumps.wikimedia.org/other/pageview_complete/'
@@ -3,8 +3,13 @@ from unittest.mock import patch, mock_open, MagicMock
 import os
 import pandas as pd
 import gzip
+import zlib
+import bz2
 import shutil
-from datetime import datetime
+import json
+import sqlite3
+import tempfile
+from datetime import date, datetime
 import requests
 import mysql.connector
 from bs4 import BeautifulSoup
@@ -21,8 +26,65 @@ from wiki_crawl import (
     unzip_file,
     search_file,
     delete_searched_files,
-    download_and_process_file
+    download_and_process_file,
+    iter_gzip_lines,
+    count_term_in_lines,
+    stream_and_process_file,
+    count_terms_in_lines,
+    load_search_terms,
+    stream_and_process_terms,
+    run_pipeline,
+    DumpCache,
+    fetch_hour_file,
+    HourIndex,
+    write_hour_index,
+    count_terms_from_index,
+    count_terms_in_blocks,
+    scan_blocks,
+    iter_lines,
+    merge_views,
+    collapse_domains,
+    SearchResult,
+    CrawlJournal,
+    HourRecorders,
+    validate_date_range,
+    get_date_range_span,
+    fetch_month_links,
+    extract_hrefs,
+    parse_dump_filename,
+    ListingCache,
+    DownloadClient,
+    DataBaseWriter,
+    SQLiteStore,
+    FileStore,
+    open_store,
+    BatchJob,
+    load_jobs,
+    main,
+    RunMetrics,
+    scan_chunks_timed,
+    TitleMatcher,
+    get_title_matcher,
+    normalize_title,
+    fold_ascii_title,
+    TopTitles,
+    count_title_views,
+    run_top_titles,
+    read_pageview_chunks,
+    count_terms_with_pandas,
+    parse_hourly_counts,
+    daily_domain_code,
+    scan_hour_data,
+    scan_hour_data_timed,
+    DEFAULT_PANDAS_MEMORY_MB,
+    SCAN_ENGINES,
+    fetch_source_links,
+    iter_gzip_blocks_parallel,
+    gzip_member_offsets,
+    parse_args,
+    follow_search
 )
+from benchmark import generate_dump, generate_dumps_directory, start_dumps_server, measure_inflate
 
 # Patch the config module where it's imported in wiki_crawl.py
 # This needs to be done before any imports that rely on `config`
@@ -78,6 +140,63 @@ class TestWikiCrawlFunctions(unittest.TestCase):
         self.assertEqual(get_search_span(2023, 1, 1, 3), ['20230101', '20230102', '20230103'])
         self.assertEqual(get_search_span(2023, 12, 25, 25), ['20231225'])
 
+    def test_validate_date_range(self):
+        self.assertEqual(validate_date_range('2023-11-15', '2024-02-10'), (datetime(2023, 11, 15).date(), datetime(2024, 2, 10).date()))
+        with self.assertRaises(ValueError):
+            validate_date_range('2024-02-10', '2023-11-15')
+        with self.assertRaises(ValueError):
+            validate_date_range('2014-12-31', '2015-01-01')
+        with self.assertRaises(ValueError):
+            validate_date_range('2023-02-29', '2023-03-01')
+
+    def test_get_date_range_span(self):
+        span = get_date_range_span(datetime(2023, 12, 30).date(), datetime(2024, 1, 2).date())
+        self.assertEqual(span, ['20231230', '20231231', '20240101', '20240102'])
+
+    @patch.object(requests.Session, 'get')
+    def test_fetch_month_links(self, mock_get):
+        listings = {
+            'http://base/2023/2023-12/': b'<a href="../">Parent</a><a href="pageviews-20231231-230000.gz">a</a>'
+                                         b'<a href="pageviews-20231230-000000.gz">b</a><a href="projectviews-20231231-230000">c</a>',
+            'http://base/2024/2024-01/': b'<a href="pageviews-20240101-000000.gz">d</a><a href="pageviews-20240102-000000.gz">e</a>',
+        }
+        def fake_get(url, headers, timeout):
+            response = MagicMock()
+            response.content = listings[url]
+            return response
+        mock_get.side_effect = fake_get
+
+        links = fetch_month_links('http://base/', ['20231231', '20240101'], max_workers=2)
+        self.assertEqual(links, ['2023/2023-12/pageviews-20231231-230000.gz', '2024/2024-01/pageviews-20240101-000000.gz'])
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_listing_workers_stay_within_connection_cap(self):
+        self.assertEqual(parse_args(['--listing-workers', '8', '--max-connections', '2']).listing_workers, 2)
+        self.assertEqual(parse_args(['--listing-workers', '1']).listing_workers, 1)
+        self.assertLessEqual(parse_args([]).listing_workers, parse_args([]).max_connections)
+
+    def test_extract_hrefs_and_parse_dump_filename(self):
+        html = b'<html><a href="../">../</a>\n<a HREF="pageviews-20230101-010000.gz">x</a> 01-Jan-2023 <a class="f" href="projectviews-20230101-010000">y</a>'
+        self.assertEqual(extract_hrefs(html), ['../', 'pageviews-20230101-010000.gz', 'projectviews-20230101-010000'])
+        self.assertEqual(parse_dump_filename('pageviews-20230101-010000.gz'), ('20230101', '01'))
+        self.assertIsNone(parse_dump_filename('projectviews-20230101-010000'))
+        self.assertIsNone(parse_dump_filename('pageviews-20230101-010000.gz.md5'))
+
+    @patch('wiki_crawl.requests.get')
+    def test_listing_cache_revalidation(self, mock_get):
+        first = MagicMock(status_code=200, content=b'<a href="pageviews-20230101-000000.gz">a</a>', headers={'ETag': '"v1"'})
+        unchanged = MagicMock(status_code=304)
+        mock_get.side_effect = [first, unchanged]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'listings.json')
+            listing_cache = ListingCache(path)
+            self.assertEqual(Wiki('http://base/').fetch_hour_files(listing_cache), ['pageviews-20230101-000000.gz'])
+            listing_cache.save()
+
+            self.assertEqual(Wiki('http://base/').fetch_hour_files(ListingCache(path)), ['pageviews-20230101-000000.gz'])
+        self.assertEqual(mock_get.call_args_list[1][1]['headers'], {'If-None-Match': '"v1"'})
+        unchanged.raise_for_status.assert_not_called()
+
     def test_display_search_dates(self):
         self.assertEqual(display_search_dates(['20230101', '20230102']), '20230101 - 20230102')
         self.assertEqual(display_search_dates(['20230101']), '20230101')
@@ -255,6 +374,266 @@ class TestDataBaseClass(unittest.TestCase):
         mock_cursor.close.assert_called_once()
         mock_mydb.close.assert_called_once()
 
+class TestDataBaseWriter(unittest.TestCase):
+
+    def setUp(self):
+        DataBaseWriter.pools = {}
+
+    @patch('wiki_crawl.mysql.connector.pooling.MySQLConnectionPool')
+    @patch('wiki_crawl.DATABASE_CONFIG', {'host': 'test_host', 'user': 'test_user', 'password': 'test_password', 'database': 'test_db'})
+    def test_batches_and_pool_reuse(self, mock_pool_class):
+        mock_connection = mock_pool_class.return_value.get_connection.return_value
+        mock_cursor = mock_connection.cursor.return_value
+
+        with DataBaseWriter(batch_size=3, flush_seconds=3600) as database:
+            database.store_batch({'GameA': 1, 'GameB': 2}, '20230101')
+            mock_cursor.executemany.assert_not_called()
+            database.store_data('GameC', 3, '20230101') # Fills the batch
+            self.assertEqual(mock_cursor.executemany.call_count, 1)
+            self.assertIn('ON DUPLICATE KEY UPDATE', mock_cursor.executemany.call_args[0][0])
+            database.store_domain_breakdown({'GameA': {'en': 1}}, '20230101')
+        self.assertEqual(mock_cursor.executemany.call_args[0][1], [('GameA', 'en', 1, '20230101')])
+        self.assertEqual(mock_connection.commit.call_count, 2)
+        self.assertEqual(mock_connection.close.call_count, 2)
+
+        DataBaseWriter(pool_size=2)
+        mock_pool_class.assert_called_once_with(pool_name='wiki_crawl_2', pool_size=2, host='test_host', user='test_user',
+                                                password='test_password', database='test_db')
+
+    @patch('wiki_crawl.mysql.connector.pooling.MySQLConnectionPool')
+    def test_flush_failure_rolls_back(self, mock_pool_class):
+        mock_connection = mock_pool_class.return_value.get_connection.return_value
+        mock_connection.cursor.return_value.executemany.side_effect = mysql.connector.Error('Insert failed')
+
+        database = DataBaseWriter()
+        database.store_data('GameA', 1, '20230101')
+        with self.assertRaises(mysql.connector.Error):
+            database.flush()
+        mock_connection.rollback.assert_called_once()
+        mock_connection.close.assert_called_once()
+
+class TestLocalStores(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _result(self):
+        result = SearchResult.from_links(['GameA'], ['pageviews-20230101-050000.gz'])
+        result.record('pageviews-20230101-050000.gz', {'GameA': 4})
+        return result
+
+    def test_sqlite_store_upserts(self):
+        path = os.path.join(self.tmp_dir, 'results.sqlite')
+        with open_store('sqlite', path, batch_size=2) as store:
+            store.store_batch({'GameA': 1, 'GameB': 2}, '20230101')
+            store.store_data('GameA', 10, '20230101') # Replaces the first GameA row
+            store.store_hourly(self._result())
+        self.assertIsInstance(store, SQLiteStore)
+        self.assertEqual(store.rows_written, 4)
+
+        connection = sqlite3.connect(path)
+        self.assertEqual(connection.execute('SELECT game_title, total_searches FROM games ORDER BY game_title').fetchall(),
+                         [('GameA', 10), ('GameB', 2)])
+        self.assertEqual(connection.execute('SELECT * FROM game_hourly_views').fetchall(), [('GameA', '2023-01-01 05:00:00', 4)])
+        connection.close()
+
+    def test_csv_store_appends(self):
+        for total in (1, 2):
+            with open_store('csv', self.tmp_dir) as store:
+                store.store_domain_breakdown({'GameA': {'en': total}}, '20230101')
+        self.assertIsInstance(store, FileStore)
+        stored = pd.read_csv(os.path.join(self.tmp_dir, 'game_domains.csv'))
+        self.assertEqual(list(stored.columns), ['game_title', 'domain_code', 'total_searches', 'search_dates'])
+        self.assertEqual(stored['total_searches'].tolist(), [1, 2])
+
+    def test_parquet_totals_are_integers_in_every_table(self):
+        # No Parquet engine is needed to see the frames each part file would be written from
+        with patch.object(pd.DataFrame, 'to_parquet', autospec=True) as to_parquet:
+            with open_store('parquet', self.tmp_dir) as store:
+                store.store_batch({'GameA': 1}, '20230101')
+                store.store_domain_breakdown({'GameA': {'en': 1}}, '20230101')
+                store.store_hourly(self._result())
+        frames = [call.args[0] for call in to_parquet.call_args_list]
+        self.assertEqual(len(frames), 3)
+        for frame in frames:
+            self.assertEqual(str(frame['total_searches'].dtype), 'int64')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            open_store('redis')
+
+class TestBatchJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_jobs(self, jobs, name='jobs.json'):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as job_file:
+            json.dump(jobs, job_file)
+        return path
+
+    def test_load_jobs(self):
+        path = self._write_jobs({'jobs': [
+            {'name': 'q', 'start': '2023-12-31', 'end': '2024-01-01', 'terms': ['GameA'], 'domains': ['en']},
+            {'start': '2024-01-01', 'terms': ['GameB']},
+        ]})
+        jobs = load_jobs(path)
+        self.assertEqual([job.name for job in jobs], ['q', 'job-2'])
+        self.assertEqual(jobs[0].search_dates, ['20231231', '20240101'])
+        self.assertEqual(jobs[1].search_dates, ['20240101'])
+
+        with self.assertRaises(ValueError):
+            load_jobs(self._write_jobs([{'start': '2024-01-01'}], 'no_terms.json'))
+
+    def test_batch_job_record_filters_dates_and_domains(self):
+        job = BatchJob('q', datetime(2023, 1, 1).date(), datetime(2023, 1, 1).date(), ['GameA'], domains=['en'])
+        job.record('2023/2023-01/pageviews-20230101-000000.gz', {'GameA': {'en': 2, 'de': 5}, 'GameB': {'en': 1}})
+        job.record('2023/2023-01/pageviews-20230102-000000.gz', {'GameA': {'en': 100}})
+        self.assertEqual(job.totals, {'GameA': {'en': 2}})
+
+    @patch.object(requests.Session, 'get')
+    def test_overlapping_jobs_fetch_each_hour_once(self, mock_get):
+        hours = {
+            'pageviews-20230101-000000.gz': b'en GameA 1 0\nde GameA 2 0\nen GameB 4 0\n',
+            'pageviews-20230102-000000.gz': b'en GameA 10 0\nen GameB 40 0\n',
+            'pageviews-20230103-000000.gz': b'en GameA 100 0\n',
+        }
+        def fake_get(url, headers=None, stream=False, timeout=None):
+            response = MagicMock(status_code=200)
+            if url.endswith('/'):
+                response.content = ''.join(f'<a href="{name}">{name}</a>' for name in hours).encode()
+            else:
+                response.__enter__.return_value.status_code = 200
+                response.__enter__.return_value.iter_content.return_value = [gzip.compress(hours[url.rsplit('/', 1)[-1]])]
+            return response
+        mock_get.side_effect = fake_get
+
+        path = self._write_jobs([
+            {'name': 'early', 'start': '2023-01-01', 'end': '2023-01-02', 'terms': ['GameA', 'GameB'], 'domains': ['en']},
+            {'name': 'late', 'start': '2023-01-02', 'end': '2023-01-03', 'terms': ['GameA']},
+        ])
+        main(['--job-file', path, '--storage', 'csv', '--storage-path', self.tmp_dir])
+
+        downloads = [call[0][0] for call in mock_get.call_args_list if not call[0][0].endswith('/')]
+        self.assertEqual(len(downloads), 3)
+        stored = pd.read_csv(os.path.join(self.tmp_dir, 'games.csv'))
+        self.assertEqual(stored.values.tolist(), [['GameA', 11, '20230101 - 20230102'], ['GameB', 44, '20230101 - 20230102'],
+                                                  ['GameA', 110, '20230102 - 20230103']])
+
+class TestFollowMode(unittest.TestCase):
+
+    HOURS = {
+        'pageviews-20230101-230000.gz': b'en GameA 1 0\nen GameB 4 0\n',
+        'pageviews-20230102-000000.gz': b'en GameA 10 0\n',
+        'pageviews-20230102-010000.gz': b'en GameA 100 0\nde GameA 1000 0\n',
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.published = list(self.HOURS)[:2]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _fake_get(self, url, headers=None, stream=False, timeout=None):
+        response = MagicMock(status_code=200)
+        if url.endswith('/'):
+            etag = f'"{len(self.published)}"'
+            if (headers or {}).get('If-None-Match') == etag:
+                response.status_code = 304
+            response.headers = {'ETag': etag}
+            response.content = ''.join(f'<a href="{name}">{name}</a>' for name in self.published).encode()
+        else:
+            response.__enter__.return_value.status_code = 200
+            response.__enter__.return_value.iter_content.return_value = [gzip.compress(self.HOURS[url.rsplit('/', 1)[-1]])]
+        return response
+
+    def _stored_totals(self) -> dict:
+        with sqlite3.connect(os.path.join(self.tmp_dir, 'results.sqlite')) as connection:
+            return dict(connection.execute('SELECT game_title, total_searches FROM games WHERE search_dates = ?', ('20230101 - now',)))
+
+    @patch('wiki_crawl.utc_today', return_value=date(2023, 1, 2))
+    @patch.object(requests.Session, 'get')
+    def test_follow_counts_each_new_hour_once(self, mock_get, mock_today):
+        mock_get.side_effect = self._fake_get
+        args = parse_args(['--follow', '--terms', 'GameA', 'GameB', '--domains', 'en', '--storage', 'sqlite',
+                           '--storage-path', os.path.join(self.tmp_dir, 'results.sqlite'),
+                           '--journal', os.path.join(self.tmp_dir, 'journal.sqlite')])
+
+        # The third hour is published while the follower sleeps between its second and third poll
+        sleeps = []
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 2:
+                self.published.append(list(self.HOURS)[2])
+        with patch('wiki_crawl.time.sleep', side_effect=fake_sleep):
+            totals = follow_search(args, ['GameA', 'GameB'], '20230101', max_polls=3)
+        self.assertEqual(sleeps, [600.0, 600.0])
+        self.assertEqual(totals, {'GameA': 111, 'GameB': 4})
+        self.assertEqual(self._stored_totals(), {'GameA': 111, 'GameB': 4})
+        downloads = [call[0][0] for call in mock_get.call_args_list if not call[0][0].endswith('/')]
+        self.assertEqual(len(downloads), 3)
+        self.assertTrue(any(call[1]['headers'].get('If-None-Match') for call in mock_get.call_args_list if call[0][0].endswith('/')))
+
+        # A restarted follower takes the counted hours from the journal instead of downloading them again
+        mock_get.reset_mock()
+        self.assertEqual(follow_search(args, ['GameA', 'GameB'], '20230102', max_polls=1), {'GameA': 110, 'GameB': 0})
+        self.assertFalse([call for call in mock_get.call_args_list if not call[0][0].endswith('/')])
+        with sqlite3.connect(os.path.join(self.tmp_dir, 'results.sqlite')) as connection:
+            self.assertEqual(connection.execute("SELECT SUM(total_searches) FROM games WHERE search_dates = '20230102 - now'").fetchone(), (110,))
+
+    @patch('wiki_crawl.utc_today', return_value=date(2023, 1, 3))
+    @patch.object(requests.Session, 'get')
+    def test_follow_retries_a_failed_backfill_hour(self, mock_get, mock_today):
+        # Once the backfill is done only 2023-01-02 and 2023-01-03 are listed, so the failed hour of
+        # 2023-01-01 has to be remembered to be tried again
+        failures = []
+        def flaky_get(url, **kwargs):
+            if url.endswith('pageviews-20230101-230000.gz') and not failures:
+                failures.append(url)
+                raise requests.exceptions.ConnectionError('connection reset')
+            return self._fake_get(url, **kwargs)
+        mock_get.side_effect = flaky_get
+        args = parse_args(['--follow', '--terms', 'GameA', 'GameB', '--max-retries', '0', '--no-journal',
+                           '--storage', 'sqlite', '--storage-path', os.path.join(self.tmp_dir, 'results.sqlite')])
+        with patch('wiki_crawl.time.sleep'):
+            totals = follow_search(args, ['GameA', 'GameB'], '20230101', max_polls=2)
+        self.assertEqual(failures, [failures[0]])
+        self.assertEqual(totals, {'GameA': 11, 'GameB': 4})
+        self.assertEqual(self._stored_totals(), {'GameA': 11, 'GameB': 4})
+
+    @patch('wiki_crawl.utc_today', return_value=date(2023, 1, 2))
+    @patch.object(requests.Session, 'get')
+    def test_follow_exports_metrics_after_every_poll(self, mock_get, mock_today):
+        mock_get.side_effect = self._fake_get
+        metrics_json = os.path.join(self.tmp_dir, 'metrics.json')
+        metrics_prometheus = os.path.join(self.tmp_dir, 'metrics.prom')
+        args = parse_args(['--follow', '--terms', 'GameA', '--storage', 'sqlite', '--no-journal',
+                           '--storage-path', os.path.join(self.tmp_dir, 'results.sqlite'),
+                           '--metrics-json', metrics_json, '--metrics-prometheus', metrics_prometheus])
+
+        # The follower is still running while it sleeps, so the files must already reflect the polls so far
+        exported = []
+        def fake_sleep(seconds):
+            with open(metrics_json) as file_in:
+                hours = json.load(file_in)['hours']
+            with open(metrics_prometheus) as file_in:
+                self.assertIn(f'wiki_crawl_hours_total {hours}\n', file_in.read())
+            exported.append(hours)
+            if len(exported) == 1:
+                self.published.append(list(self.HOURS)[2])
+        with patch('wiki_crawl.time.sleep', side_effect=fake_sleep):
+            follow_search(args, ['GameA'], '20230101', max_polls=3)
+        self.assertEqual(exported, [2, 3])
+        self.assertFalse([name for name in os.listdir(self.tmp_dir) if name.endswith('.tmp')])
+
 class TestDownloadAndProcessFile(unittest.TestCase):
 
     @patch('wiki_crawl.requests.get')
@@ -299,5 +678,698 @@ class TestDownloadAndProcessFile(unittest.TestCase):
         mock_delete.assert_called_once_with(['20230101-hourly.gz'])
         self.assertEqual(updated_total, 0)
 
+class TestStreamingSearch(unittest.TestCase):
+
+    def _chunks(self, data, size=7):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_iter_gzip_lines_multi_member(self):
+        data = gzip.compress(b'en Python 1 0\nen Ja') + gzip.compress(b'va 2 0\nfr Python 3 0\n')
+        lines = list(iter_gzip_lines(self._chunks(data)))
+        self.assertEqual(lines, [b'en Python 1 0', b'en Java 2 0', b'fr Python 3 0'])
+
+    def test_iter_gzip_lines_truncated(self):
+        data = gzip.compress(b'en Python 1 0\n' * 100)
+        with self.assertRaises(Exception):
+            list(iter_gzip_lines([data[:-10]]))
+
+    def test_count_term_in_lines(self):
+        lines = [
+            b'en Python 100 0',
+            b'fr Python 200 0',
+            b'en Python abc 0',        # non-numeric count is dropped
+            b'en Python 5 0 extra',    # too many fields is skipped
+            b'de Python 7',            # missing response size still counts
+            b'en Java 50 0',
+            b'',
+        ]
+        self.assertEqual(count_term_in_lines(lines, 'Python'), 307)
+        self.assertEqual(count_term_in_lines(lines, 'C++'), 0)
+
+    @patch('wiki_crawl.requests.get')
+    def test_stream_and_process_file_success(self, mock_get):
+        data = gzip.compress(b'en TestPage 10 0\nen Other 5 0\nde TestPage 2 0\n')
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.iter_content.return_value = self._chunks(data)
+
+        link = 'pageviews-20230101-000000.gz\n'
+        search_url = 'http://test.wikipedia.org/downloads/'
+        updated_total = stream_and_process_file(link, search_url, 'TestPage', 100)
+
+        mock_get.assert_called_once_with(search_url + link.strip(), stream=True, timeout=30)
+        self.assertEqual(updated_total, 112)
+
+    def test_count_terms_in_lines(self):
+        lines = [b'en Python 100 0', b'fr Java 20 0', b'en Rust 3 0', b'de Python 1 0']
+        self.assertEqual(count_terms_in_lines(lines, ['Python', 'Java', 'Go']), {'Python': 101, 'Java': 20, 'Go': 0})
+
+    @patch('builtins.open', new_callable=mock_open, read_data='Python\n\n# comment\nJava\nPython\n')
+    def test_load_search_terms(self, mock_file_open):
+        self.assertEqual(load_search_terms(['Go', 'Java'], 'terms.txt'), ['Go', 'Java', 'Python'])
+        mock_file_open.assert_called_once_with('terms.txt', 'r', encoding='utf-8')
+        self.assertEqual(load_search_terms(), [])
+
+    @patch('wiki_crawl.requests.get')
+    def test_stream_and_process_terms(self, mock_get):
+        data = gzip.compress(b'en GameA 10 0\nen GameB 5 0\nde GameA 2 0\n')
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = [data]
+
+        totals = stream_and_process_terms('pageviews-20230101-000000.gz', 'http://test/', ['GameA', 'GameB'], {'GameA': 1, 'GameB': 0})
+        self.assertEqual(totals, {'GameA': 13, 'GameB': 5})
+
+    @patch('wiki_crawl.requests.get')
+    def test_stream_and_process_file_download_failure(self, mock_get):
+        mock_get.side_effect = requests.exceptions.RequestException('Download error')
+        updated_total = stream_and_process_file('pageviews-20230101-000000.gz', 'http://test/', 'TestPage', 7)
+        self.assertEqual(updated_total, 7)
+
+class TestScanEngines(unittest.TestCase):
+
+    DUMP = (b'en Python 100 5\n'
+            b'en.m Python 3 0\n'
+            b'fr Python abc 0\n'        # non-numeric count is dropped
+            b'en Python 5 0 extra\n'    # too many fields is skipped
+            b'de Python 7\n'            # missing response size still counts
+            b'en Python\n'              # missing count is dropped
+            b'en Pythonic 9 0\n'
+            b'en Monty_Python 9 0\n'
+            b'en Java 50 0\n'
+            b'en 50 Java 0\n'
+            b'de Java 1.0 0\n'
+            b'en NULL 7 0\n'             # titles pandas would read as missing values
+            b'en NA 3 0\n'
+            b'en Java 2 0')              # no trailing newline
+
+    def _blocks(self, size):
+        return [self.DUMP[i:i + size] for i in range(0, len(self.DUMP), size)]
+
+    def test_engines_agree(self):
+        terms = ['Python', 'Java', '50', 'Rust', 'NULL', 'NA']
+        expected = {'Python': 110, 'Java': 53, '50': 0, 'Rust': 0, 'NULL': 7, 'NA': 3}
+        for size in (1, 5, 16, len(self.DUMP)):
+            self.assertEqual(count_terms_in_blocks(self._blocks(size), terms), expected)
+            self.assertEqual(count_terms_in_lines(iter_lines(self._blocks(size)), terms), expected)
+        self.assertEqual(scan_blocks(self._blocks(16), terms, engine='pandas'), expected)
+
+    def test_engines_agree_on_quoted_titles(self):
+        # Titles can start or end with a double quote; pandas must not read from one quote to the next across lines
+        dump = b'en "Foo 5 0\nen Bar 3 0\nen Foo" 2 0\nen "Quoted" 7 0\n'
+        terms = ['"Foo', 'Bar', 'Foo"', '"Quoted"', 'Quoted']
+        expected = {'"Foo': 5, 'Bar': 3, 'Foo"': 2, '"Quoted"': 7, 'Quoted': 0}
+        self.assertEqual(count_terms_in_blocks([dump], terms), expected)
+        self.assertEqual(scan_blocks([dump], terms, engine='pandas'), expected)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            text_file = os.path.join(tmp_dir, 'hour.txt')
+            with open(text_file, 'wb') as file_out:
+                file_out.write(dump)
+            self.assertEqual(search_file(text_file, 'Bar', 0), 3)
+            self.assertEqual(search_file(text_file, 'Bar', 0, max_memory_mb=1), 3)
+
+    def test_domain_filter_and_breakdown(self):
+        expected = {'Python': {'en': 100, 'en.m': 3}, 'Java': {'en': 52}}
+        for engine in ('bytes', 'pandas'):
+            self.assertEqual(scan_blocks(self._blocks(16), ['Python', 'Java'], engine, domains=['en', 'en.m'], by_domain=True), expected)
+            self.assertEqual(scan_blocks(self._blocks(16), ['Python', 'Java'], engine, domains=['en.m']), {'Python': 3, 'Java': 0})
+        self.assertEqual(count_terms_in_lines(iter_lines(self._blocks(16)), ['Python', 'Java'], ['en', 'en.m'], by_domain=True), expected)
+
+    def test_merge_and_collapse_views(self):
+        totals = merge_views({'Python': {'en': 1}}, {'Python': {'en': 2, 'de': 3}})
+        self.assertEqual(totals, {'Python': {'en': 3, 'de': 3}})
+        self.assertEqual(collapse_domains(totals), {'Python': 6})
+        self.assertEqual(merge_views({'Python': 1}, {'Python': 2}), {'Python': 3})
+
+    @patch('wiki_crawl.PREFILTER_MAX_TERMS', 1)
+    def test_scan_blocks_many_terms_uses_line_scan(self):
+        self.assertEqual(scan_blocks(self._blocks(16), ['Python', 'Java']), {'Python': 110, 'Java': 53})
+
+    def test_scan_blocks_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            scan_blocks([], ['Python'], engine='regex')
+
+    def test_parallel_inflate_of_multi_member_gzip(self):
+        members = [gzip.compress(self.DUMP[i:i + 40]) for i in range(0, len(self.DUMP), 40)]
+        data = b''.join(members)
+        self.assertEqual(gzip_member_offsets(data, len(members)), [0] + [sum(map(len, members[:i])) for i in range(1, len(members))])
+        for workers in (2, 3):
+            self.assertEqual(b''.join(iter_gzip_blocks_parallel([data], workers)), self.DUMP)
+            self.assertEqual(scan_hour_data(data, ('Python', 'Java'), inflate_workers=workers), {'Python': 110, 'Java': 53})
+        single = gzip.compress(self.DUMP)
+        self.assertEqual(gzip_member_offsets(single, 4), [0])
+        self.assertEqual(b''.join(iter_gzip_blocks_parallel([single], 4)), self.DUMP)
+        with self.assertRaises(zlib.error):
+            list(iter_gzip_blocks_parallel([data[:-3]], 2))
+
+    def test_parallel_inflate_recovers_from_a_false_member_start(self):
+        members = [gzip.compress(self.DUMP[i:i + 40]) for i in range(0, len(self.DUMP), 40)]
+        data = b''.join(members)
+        boundary = len(members[0])
+        # A split inside the second member: the first piece inflates, the second is redone serially
+        with patch('wiki_crawl.gzip_member_offsets', return_value=[0, boundary, boundary + 7]):
+            self.assertEqual(b''.join(iter_gzip_blocks_parallel([data], 2)), self.DUMP)
+
+    @patch('wiki_crawl.PANDAS_FIRST_CHUNK_BYTES', 40)
+    def test_chunked_pandas_reading(self):
+        chunks = list(read_pageview_chunks(self._blocks(16), max_memory_mb=0))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(str(chunks[0]['Domain Code'].dtype), 'category')
+        self.assertEqual(str(chunks[0]['Count Views'].dtype), 'int32')
+        self.assertNotIn('Response Size', chunks[0].columns)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 10)
+        expected = {'Python': {'en': 100, 'en.m': 3, 'de': 7}, 'Java': {'en': 52, 'de': 1}}
+        for max_memory_mb in (None, 0):
+            self.assertEqual(count_terms_with_pandas(self._blocks(5), ['Python', 'Java'], by_domain=True,
+                                                     max_memory_mb=max_memory_mb), expected)
+
+    def test_pandas_memory_setting_reaches_the_chunk_reader(self):
+        data = gzip.compress(self.DUMP)
+        self.assertEqual(parse_args(['--pandas-memory-mb', '16']).pandas_memory_mb, 16)
+        self.assertEqual(parse_args([]).pandas_memory_mb, DEFAULT_PANDAS_MEMORY_MB)
+        with patch('wiki_crawl.read_pageview_chunks', wraps=read_pageview_chunks) as reader:
+            self.assertEqual(scan_hour_data(data, ('Python',), 'pandas', max_memory_mb=16), {'Python': 110})
+            views, _ = scan_hour_data_timed(data, ('Python',), 'pandas', None, False, 'exact', 1, 8, None)
+            self.assertEqual(views, {'Python': 110})
+        self.assertEqual([call.args[1] for call in reader.call_args_list], [16, 8])
+
+    def test_engines_agree_on_counts_past_int32(self):
+        dump = b'en Huge 3000000000 0\nen Huge 22 0\nen Small 5 0\n'
+        expected = {'Huge': 3000000022, 'Small': 5}
+        for engine in SCAN_ENGINES:
+            self.assertEqual(scan_blocks([dump], ['Huge', 'Small'], engine), expected)
+        self.assertEqual(str(next(read_pageview_chunks([b'en Small 5 0\n']))['Count Views'].dtype), 'int32')
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as text_file:
+            text_file.write(dump)
+        try:
+            for max_memory_mb in (None, 0):
+                self.assertEqual(search_file(text_file.name, 'Huge', 0, max_memory_mb=max_memory_mb), 3000000022)
+        finally:
+            os.remove(text_file.name)
+
+    @patch('wiki_crawl.PANDAS_FIRST_CHUNK_BYTES', 40)
+    def test_search_file_chunked(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as text_file:
+            text_file.write(self.DUMP)
+        try:
+            self.assertEqual(search_file(text_file.name, 'Python', 5, max_memory_mb=0), 115)
+            self.assertEqual(search_file(text_file.name, 'Python', 5), 115)
+            for max_memory_mb in (None, 0):
+                self.assertEqual(search_file(text_file.name, 'NULL', 0, max_memory_mb=max_memory_mb), 7)
+        finally:
+            os.remove(text_file.name)
+
+    def test_normalized_matching(self):
+        self.assertEqual(normalize_title('Elden%20Ring'), 'elden ring')
+        self.assertEqual(normalize_title(' ELDEN__Ring '), 'elden ring')
+        dump = ('en Elden_Ring 10 0\n'
+                'en.m elden_ring 2 0\n'
+                'de Elden%20Ring 3 0\n'
+                'en Elden_Ring_Nightreign 4 0\n'
+                'en Elden_Ring x 0\n'
+                'fr Élan 5 0\n').encode('utf-8')
+        blocks = [dump[:17], dump[17:]]
+        for engine in ('bytes', 'pandas'):
+            self.assertEqual(scan_blocks(blocks, ['Elden Ring', 'ÉLAN'], engine, match='normalized'), {'Elden Ring': 15, 'ÉLAN': 5})
+            self.assertEqual(scan_blocks(blocks, ['elden ring'], engine, match='prefix'), {'elden ring': 19})
+            self.assertEqual(scan_blocks(blocks, [r'ring$', r'^elden ring \w+'], engine, ['en'], by_domain=True, match='regex'),
+                             {r'ring$': {'en': 10}, r'^elden ring \w+': {'en': 4}})
+        self.assertEqual(scan_blocks(blocks, ['Elden Ring']), {'Elden Ring': 0})
+        with self.assertRaises(ValueError):
+            scan_blocks(blocks, ['Elden Ring'], match='fuzzy')
+
+    def test_title_matcher_memo(self):
+        matcher = TitleMatcher(['Elden Ring', 'elden_ring'], 'normalized')
+        self.assertEqual(matcher(b'Elden_Ring'), ('Elden Ring', 'elden_ring'))
+        self.assertEqual(matcher(b'Other'), ())
+        self.assertEqual(matcher.memo, {b'Elden_Ring': ('Elden Ring', 'elden_ring'), b'Other': ()})
+        # A full memo keeps what it has; new titles are still matched, just not remembered
+        with patch('wiki_crawl.TITLE_MEMO_MAX_ENTRIES', 2):
+            self.assertEqual(matcher(b'elden%20ring'), ('Elden Ring', 'elden_ring'))
+        self.assertEqual(matcher.memo, {b'Elden_Ring': ('Elden Ring', 'elden_ring'), b'Other': ()})
+
+    def test_fold_ascii_title_matches_normalize_title(self):
+        for raw in (b'Elden_Ring', b'__ELDEN___Ring_', b'A+B', b'Foo"Bar', b'x', b'_', b'Tab\tTitle'):
+            folded = fold_ascii_title(raw)
+            if folded is not None:
+                self.assertEqual(folded, normalize_title(raw.decode()))
+        self.assertEqual(fold_ascii_title(b'__ELDEN___Ring_'), 'elden ring')
+        for raw in ('Elden%20Ring', 'Élan', 'Tab\tTitle', 'İstanbul'):
+            self.assertIsNone(fold_ascii_title(raw.encode('utf-8')))
+
+    def test_title_matcher_is_reused_across_hours(self):
+        get_title_matcher.cache_clear()
+        first_hour = gzip.compress(b'en Elden_Ring 10 0\nen Other 1 0\n')
+        second_hour = gzip.compress(b'en Elden_Ring 20 0\nen Other 2 0\nde Elden_Ring_DLC 3 0\n')
+        for engine in ('bytes', 'pandas'):
+            self.assertEqual(scan_hour_data(first_hour, ('elden ring',), engine, match='regex'), {'elden ring': 10})
+        # Only the title the second hour adds has to go through the patterns
+        with patch.object(TitleMatcher, 'match_normalized', autospec=True, side_effect=TitleMatcher.match_normalized) as match_normalized:
+            for engine in ('bytes', 'pandas'):
+                self.assertEqual(scan_hour_data(second_hour, ('elden ring',), engine, match='regex'), {'elden ring': 23})
+        self.assertEqual([call.args[1] for call in match_normalized.call_args_list], ['elden ring dlc'])
+        self.assertIs(get_title_matcher(('elden ring',), 'regex'), get_title_matcher(('elden ring',), 'regex'))
+        # Patterns see the normalized title, where underscores have become spaces
+        self.assertEqual(scan_hour_data(first_hour, ('Elden_Ring',), match='regex'), {'Elden_Ring': 0})
+
+class TestSearchResult(unittest.TestCase):
+
+    LINKS = ['pageviews-20230101-230000.gz', 'pageviews-20230102-000000.gz', 'pageviews-20230102-010000.gz']
+
+    def test_record_and_aggregate(self):
+        result = SearchResult.from_links(['GameA', 'GameB'], self.LINKS)
+        result.record('pageviews-20230101-230000.gz\n', {'GameA': 1, 'GameB': 2})
+        result.record('pageviews-20230102-010000.gz', {'GameA': {'en': 10, 'de': 5}, 'GameB': {}})
+
+        self.assertEqual(result.totals(), {'GameA': 16, 'GameB': 2})
+        hourly = result.to_frame()
+        self.assertEqual(len(hourly), 4) # The hour that never completed is left out
+        self.assertEqual(list(hourly[hourly['term'] == 'GameA']['views']), [1, 15])
+        daily = result.to_frame('D')
+        self.assertEqual(list(daily['views']), [1, 15, 2, 0])
+        self.assertEqual([str(day.date()) for day in daily['hour']], ['2023-01-01', '2023-01-02', '2023-01-01', '2023-01-02'])
+
+    def test_export_csv(self):
+        result = SearchResult.from_links(['GameA'], self.LINKS[:1])
+        result.record(self.LINKS[0], {'GameA': 7})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'hourly.csv')
+            result.export(path)
+            exported = pd.read_csv(path)
+        self.assertEqual(list(exported.columns), ['term', 'hour', 'views'])
+        self.assertEqual(exported['views'].tolist(), [7])
+
+    @patch('wiki_crawl.requests.get')
+    def test_pipeline_records_hours(self, mock_get):
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = [gzip.compress(b'en GameA 3 0\n')]
+        result = SearchResult.from_links(['GameA'], self.LINKS)
+        run_pipeline(self.LINKS, 'http://test/', ['GameA'], fetch_workers=2, scan_workers=0, result=result)
+        self.assertEqual(result.views.tolist(), [[3, 3, 3]])
+        self.assertTrue(result.completed.all())
+
+class TestCrawlJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'journal.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_and_resume(self):
+        journal = CrawlJournal(self.path, ['GameA', 'GameB'])
+        journal.record('pageviews-20230101-000000.gz\n', {'GameA': 1, 'GameB': 2})
+        journal.record('pageviews-20230101-010000.gz', {'GameA': 3, 'GameB': 0})
+        journal.close()
+
+        reopened = CrawlJournal(self.path, ['GameB', 'GameA'])
+        self.assertEqual(reopened.completed_hours(), {
+            'pageviews-20230101-000000.gz': {'GameA': 1, 'GameB': 2},
+            'pageviews-20230101-010000.gz': {'GameA': 3, 'GameB': 0},
+        })
+        self.assertEqual(CrawlJournal(self.path, ['GameA']).completed_hours(), {}) # Different search, different job
+        reopened.reset()
+        self.assertEqual(reopened.completed_hours(), {})
+
+    def test_hour_recorders(self):
+        journal = CrawlJournal(self.path, ['GameA'])
+        result = SearchResult.from_links(['GameA'], ['pageviews-20230101-000000.gz'])
+        HourRecorders(result, None, journal).record('pageviews-20230101-000000.gz', {'GameA': 5})
+        self.assertEqual(result.totals(), {'GameA': 5})
+        self.assertEqual(journal.completed_hours(), {'pageviews-20230101-000000.gz': {'GameA': 5}})
+
+class TestDownloadClient(unittest.TestCase):
+
+    def _response(self, chunks, status_code=200, error=None):
+        response = MagicMock(status_code=status_code)
+        def iter_content(chunk_size):
+            yield from chunks
+            if error is not None:
+                raise error
+        response.__enter__.return_value.iter_content.side_effect = iter_content
+        response.__enter__.return_value.status_code = status_code
+        return response
+
+    @patch('wiki_crawl.time.sleep')
+    def test_resume_with_range_after_interruption(self, mock_sleep):
+        client = DownloadClient(backoff_seconds=0)
+        with patch.object(client.session, 'get') as mock_get:
+            mock_get.side_effect = [
+                self._response([b'abc', b'de'], error=requests.exceptions.ChunkedEncodingError('reset')),
+                self._response([b'fgh'], status_code=206),
+            ]
+            self.assertEqual(client.fetch('http://test/file.gz'), b'abcdefgh')
+        self.assertEqual(mock_get.call_args_list[1][1]['headers'], {'Range': 'bytes=5-'})
+        self.assertEqual((client.files_downloaded, client.retries, client.failed_downloads, client.bytes_downloaded), (1, 1, 0, 8))
+
+    @patch('wiki_crawl.time.sleep')
+    def test_server_ignoring_range_is_skipped_ahead(self, mock_sleep):
+        client = DownloadClient(backoff_seconds=0)
+        with patch.object(client.session, 'get') as mock_get:
+            mock_get.side_effect = [
+                self._response([b'abc'], error=requests.exceptions.ConnectionError('reset')),
+                self._response([b'ab', b'cdef'], status_code=200),
+            ]
+            self.assertEqual(client.fetch('http://test/file.gz'), b'abcdef')
+
+    @patch('wiki_crawl.time.sleep')
+    def test_gives_up_after_max_retries_and_on_client_errors(self, mock_sleep):
+        client = DownloadClient(max_retries=2)
+        with patch.object(client.session, 'get', side_effect=requests.exceptions.Timeout('slow')) as mock_get:
+            with self.assertRaises(requests.exceptions.Timeout):
+                client.fetch('http://test/file.gz')
+            self.assertEqual(mock_get.call_count, 3)
+
+        not_found = requests.exceptions.HTTPError('404', response=MagicMock(status_code=404))
+        with patch.object(client.session, 'get', side_effect=not_found) as mock_get:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.fetch('http://test/missing.gz')
+            mock_get.assert_called_once()
+        self.assertEqual((client.retries, client.failed_downloads), (2, 2))
+
+    def test_rate_limit_still_applies_after_idle_time(self):
+        clock = [1000.0]
+        sleeps = []
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+        with patch('wiki_crawl.time.monotonic', side_effect=lambda: clock[0]), \
+                patch('wiki_crawl.time.sleep', side_effect=fake_sleep):
+            client = DownloadClient(chunk_size=1000, rate_limit=1000)
+            with patch.object(client.session, 'get', side_effect=lambda *args, **kwargs: self._response([b'x' * 1000] * 5)):
+                client.fetch('http://test/first.gz')
+                self.assertAlmostEqual(sum(sleeps), 4.0) # The first second's worth is a burst, the rest is paced
+                clock[0] += 3600 # An hour idle, e.g. a follow-mode poll interval
+                del sleeps[:]
+                client.fetch('http://test/second.gz')
+                self.assertAlmostEqual(sum(sleeps), 4.0)
+        self.assertAlmostEqual(client.active_seconds, 8.0) # The idle hour does not dilute the logged MB/s
+
+class TestPipeline(unittest.TestCase):
+
+    HOURS = {
+        'pageviews-20230101-000000.gz': b'en GameA 10 0\nen GameB 5 0\n',
+        'pageviews-20230101-010000.gz': b'en GameA 1 0\nde GameB 2 0\nen GameB x 0\n',
+        'pageviews-20230101-020000.gz': b'fr GameA 100 0\n',
+    }
+
+    def _fake_get(self, url, stream, timeout):
+        name = url.rsplit('/', 1)[-1]
+        if name not in self.HOURS:
+            raise requests.exceptions.RequestException('404')
+        response = MagicMock()
+        response.__enter__.return_value.iter_content.return_value = [gzip.compress(self.HOURS[name])]
+        return response
+
+    @patch('wiki_crawl.requests.get')
+    def test_run_pipeline_matches_serial(self, mock_get):
+        mock_get.side_effect = self._fake_get
+        links = list(self.HOURS) + ['pageviews-20230101-030000.gz']
+        terms = ['GameA', 'GameB']
+
+        serial = dict.fromkeys(terms, 0)
+        for link in links:
+            serial = stream_and_process_terms(link, 'http://test/', terms, serial)
+
+        for scan_workers in (0, 2):
+            result = run_pipeline(links, 'http://test/', terms, fetch_workers=3, scan_workers=scan_workers, max_pending=2)
+            self.assertEqual(result, serial)
+        self.assertEqual(serial, {'GameA': 111, 'GameB': 7})
+
+    @patch('wiki_crawl.requests.get')
+    def test_run_pipeline_records_stage_metrics(self, mock_get):
+        mock_get.side_effect = self._fake_get
+        links = list(self.HOURS)
+        for scan_workers in (0, 2):
+            metrics = RunMetrics()
+            result = run_pipeline(links, 'http://test/', ['GameA', 'GameB'], fetch_workers=2, scan_workers=scan_workers,
+                                  metrics=metrics)
+            self.assertEqual(result, {'GameA': 111, 'GameB': 7})
+
+            summary = metrics.summary()
+            self.assertEqual(summary['hours'], 3)
+            self.assertEqual(summary['stages']['download']['calls'], 3)
+            self.assertEqual(summary['stages']['scan']['lines'], 6)
+            self.assertEqual(summary['stages']['decompress']['bytes'], sum(len(data) for data in self.HOURS.values()))
+            self.assertEqual(summary['stages']['scan_queue_wait']['calls'], 3)
+            self.assertEqual(summary['per_hour']['pageviews-20230101-020000.gz']['scan_lines'], 1)
+
+class TestDailySource(unittest.TestCase):
+
+    DAY = (b'en.wikipedia GameA 1 desktop 12 A5C7\n'
+           b'en.wikipedia GameA 1 mobile-web 3 B3\n'
+           b'en.wikipedia GameA 1 mobile-app 1 X1\n'
+           b'de.wiktionary GameA 2 desktop 4 D4\n'
+           b'en.wikipedia GameB 3 desktop n/a A2B2\n'
+           b'en.wikipedia GameB 3 desktop\n')
+
+    def test_parse_hourly_counts_and_domain_codes(self):
+        self.assertEqual(parse_hourly_counts(b'A5C7X12'), {0: 5, 2: 7, 23: 12})
+        self.assertEqual(parse_hourly_counts(b''), {})
+        self.assertEqual(daily_domain_code(b'en.wikipedia', b'desktop'), b'en')
+        self.assertEqual(daily_domain_code(b'en.wikipedia', b'mobile-app'), b'en.m')
+        self.assertEqual(daily_domain_code(b'de.wiktionary', b'mobile-web'), b'de.m.d')
+        self.assertEqual(daily_domain_code(b'commons.wikimedia', b'desktop'), b'commons.m')
+
+    def test_daily_file_scans_like_hour_files(self):
+        # Two bz2 streams back to back, like a file written by a parallel compressor
+        data = bz2.compress(self.DAY[:60]) + bz2.compress(self.DAY[60:])
+        self.assertEqual(scan_hour_data(data, ('GameA', 'GameB')), {'GameA': 20, 'GameB': 4})
+        self.assertEqual(scan_hour_data(data, ('GameA',), domains=['en.m'], by_domain=True), {'GameA': {'en.m': 4}})
+        self.assertEqual(scan_hour_data(data, ('gamea',), engine='pandas', match='normalized'), {'gamea': 20})
+        self.assertEqual(scan_hour_data(gzip.compress(b'en GameA 7 0\n'), ('GameA',)), {'GameA': 7})
+        with self.assertRaises(OSError):
+            scan_hour_data(data[:-10], ('GameA',))
+
+    @patch.object(requests.Session, 'get')
+    def test_auto_source_fills_missing_days_with_hour_files(self, mock_get):
+        listings = {
+            'http://daily/2023/2023-01/': b'<a href="pageviews-20230101-user.bz2">a</a><a href="pageviews-20230101-spider.bz2">b</a>',
+            'http://hourly/2023/2023-01/': b'<a href="pageviews-20230101-000000.gz">c</a><a href="pageviews-20230102-000000.gz">d</a>'
+                                           b'<a href="pageviews-20230102-010000.gz">e</a>',
+        }
+        def fake_get(url, headers, timeout):
+            if url not in listings:
+                raise requests.exceptions.RequestException('404')
+            response = MagicMock()
+            response.content = listings[url]
+            return response
+        mock_get.side_effect = fake_get
+
+        days = ['20230101', '20230102']
+        self.assertEqual(fetch_source_links('auto', days, 1, hourly_url='http://hourly/', daily_url='http://daily/'),
+                         ['http://daily/2023/2023-01/pageviews-20230101-user.bz2',
+                          '2023/2023-01/pageviews-20230102-000000.gz', '2023/2023-01/pageviews-20230102-010000.gz'])
+        self.assertEqual(fetch_source_links('daily', days, 1, hourly_url='http://hourly/', daily_url='http://daily/'),
+                         ['http://daily/2023/2023-01/pageviews-20230101-user.bz2'])
+        self.assertEqual(len(fetch_source_links('hourly', days, 1, hourly_url='http://hourly/', daily_url='http://daily/')), 3)
+        self.assertEqual(len(fetch_source_links('auto', days, 1, hourly_url='http://hourly/', daily_url='http://missing/')), 3)
+        with self.assertRaises(requests.exceptions.RequestException):
+            fetch_source_links('daily', days, 1, hourly_url='http://hourly/', daily_url='http://missing/')
+
+    @patch.object(requests.Session, 'get')
+    def test_auto_source_falls_back_per_month(self, mock_get):
+        # Early in a month its pageview_complete directory does not exist yet; January still uses daily files
+        listings = {
+            'http://daily/2024/2024-01/': ''.join(f'<a href="pageviews-202401{day:02}-user.bz2">x</a>' for day in range(1, 32)).encode(),
+            'http://hourly/2024/2024-02/': ''.join(f'<a href="pageviews-20240201-{hour:02}0000.gz">x</a>' for hour in range(24)).encode(),
+        }
+        def fake_get(url, headers, timeout):
+            if url not in listings:
+                raise requests.exceptions.HTTPError('404')
+            response = MagicMock()
+            response.content = listings[url]
+            return response
+        mock_get.side_effect = fake_get
+
+        days = [f'202401{day:02}' for day in range(1, 32)] + ['20240201']
+        links = fetch_source_links('auto', days, 2, hourly_url='http://hourly/', daily_url='http://daily/')
+        self.assertEqual(len([link for link in links if link.endswith('.bz2')]), 31)
+        self.assertEqual(len([link for link in links if link.endswith('.gz')]), 24)
+        with self.assertRaises(requests.exceptions.RequestException):
+            fetch_source_links('daily', days, 2, hourly_url='http://hourly/', daily_url='http://daily/')
+
+class TestTopTitles(unittest.TestCase):
+
+    HOURS = {
+        'pageviews-20230101-000000.gz': b'en A 10 0\nen.m A 5 0\nen B 8 0\nen C 1 0\nen - 99 0\nen Special:Search 50 0\nen D x 0\n',
+        'pageviews-20230101-010000.gz': b'en B 9 0\nde C 3 0\nen E 2 0\nen F 1 0\n',
+    }
+
+    def _fake_get(self, url, stream, timeout):
+        response = MagicMock()
+        response.__enter__.return_value.iter_content.return_value = [gzip.compress(self.HOURS[url.rsplit('/', 1)[-1]])]
+        return response
+
+    def test_count_title_views(self):
+        lines = self.HOURS['pageviews-20230101-000000.gz'].splitlines()
+        self.assertEqual(count_title_views(lines).counts, {b'A': 15, b'B': 8, b'C': 1})
+        self.assertEqual(count_title_views(lines, domains=['en.m']).counts, {b'A': 5})
+
+    def test_approximate_summary_bounds_error(self):
+        exact = TopTitles()
+        approximate = TopTitles(capacity=2)
+        for hour in ({b'A': 10, b'B': 8, b'C': 1, b'D': 1, b'E': 1}, {b'B': 9, b'C': 3, b'E': 2, b'F': 1, b'G': 1}):
+            hour_titles = TopTitles()
+            hour_titles.counts = dict(hour)
+            exact.merge(hour_titles)
+            approximate.merge(hour_titles)
+        self.assertLessEqual(len(approximate.counts), 4)
+        self.assertEqual(approximate.top(2), exact.top(2))
+        self.assertEqual(exact.top(2), {'B': 17, 'A': 10})
+        self.assertEqual(exact.max_error, 0)
+        for title, views in exact.counts.items():
+            kept = approximate.counts.get(title, 0)
+            self.assertLessEqual(kept, views)
+            self.assertLessEqual(views - kept, approximate.max_error)
+
+    @patch('wiki_crawl.requests.get')
+    def test_run_top_titles(self, mock_get):
+        mock_get.side_effect = self._fake_get
+        for scan_workers in (0, 2):
+            for capacity in (None, 2):
+                top_titles = run_top_titles(list(self.HOURS), 'http://test/', capacity, fetch_workers=2, scan_workers=scan_workers)
+                self.assertEqual(top_titles.top(2), {'B': 17, 'A': 15})
+
+class TestRunMetrics(unittest.TestCase):
+
+    def test_scan_chunks_timed_splits_stages(self):
+        data = gzip.compress(b'en GameA 1 0\nen GameB 2 0\n')
+        totals, stats = scan_chunks_timed([data[:10], data[10:]], ('GameA',))
+        self.assertEqual(totals, {'GameA': 1})
+        self.assertEqual(stats['download_bytes'], len(data))
+        self.assertEqual(stats['lines'], 2)
+        self.assertGreaterEqual(stats['total_seconds'], stats['inflate_seconds'])
+        self.assertGreaterEqual(stats['inflate_seconds'], stats['download_seconds'])
+
+    def test_exporters(self):
+        metrics = RunMetrics()
+        metrics.add('download', 2.0, 'pageviews-20230101-000000.gz', bytes=4 * 1024 ** 2)
+        metrics.add('store', 0.5, rows=3)
+
+        summary = metrics.summary()
+        self.assertEqual(summary['stages']['download']['mb_per_second'], 2.0)
+        self.assertEqual(summary['per_hour'], {'pageviews-20230101-000000.gz': {'download_seconds': 2.0, 'download_bytes': 4 * 1024 ** 2}})
+        self.assertNotIn('per_hour', metrics.summary(include_hours=False))
+
+        prometheus = metrics.prometheus_text()
+        self.assertIn('# TYPE wiki_crawl_stage_seconds gauge', prometheus)
+        self.assertIn('wiki_crawl_stage_seconds{stage="download"} 2.0', prometheus)
+        self.assertIn('wiki_crawl_stage_rows{stage="store"} 3', prometheus)
+        self.assertEqual(prometheus.count('# TYPE wiki_crawl_stage_seconds gauge'), 1)
+        self.assertIn('wiki_crawl.download.bytes:4194304|g', metrics.statsd_lines())
+
+class TestDumpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_put_get_and_lru_eviction(self):
+        cache = DumpCache(self.cache_dir, max_bytes=10)
+        cache.put('a.gz', b'aaaa')
+        cache.put('b.gz', b'bbbb')
+        self.assertEqual(cache.get('a.gz'), b'aaaa') # a is now more recently used than b
+        cache.put('c.gz', b'cccc')
+
+        reopened = DumpCache(self.cache_dir, max_bytes=10)
+        self.assertIsNone(reopened.get('b.gz'))
+        self.assertEqual(reopened.get('a.gz'), b'aaaa')
+        self.assertEqual(reopened.get('c.gz'), b'cccc')
+        self.assertEqual((reopened.hits, reopened.misses, reopened.bytes_saved), (2, 1, 8))
+
+    def test_corrupt_entry_is_discarded(self):
+        cache = DumpCache(self.cache_dir)
+        cache.put('a.gz', b'aaaa')
+        with open(os.path.join(self.cache_dir, 'a.gz'), 'wb') as cached_file:
+            cached_file.write(b'aaab')
+        self.assertIsNone(cache.get('a.gz'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'a.gz')))
+
+    @patch('wiki_crawl.requests.get')
+    def test_fetch_hour_file_uses_cache(self, mock_get):
+        mock_get.return_value.__enter__.return_value.iter_content.return_value = [b'gz', b'data']
+        cache = DumpCache(self.cache_dir)
+
+        self.assertEqual(fetch_hour_file('pageviews-20230101-000000.gz', 'http://test/', cache), b'gzdata')
+        self.assertEqual(fetch_hour_file('pageviews-20230101-000000.gz', 'http://test/', cache), b'gzdata')
+        mock_get.assert_called_once()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+class TestHourIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def test_write_and_lookup(self):
+        lines = [b'en Zeta 1 0', b'en Alpha 10 0', b'de Alpha 5 0', b'en Beta x 0', b'en Gamma 3 0 extra', 'en Ünïcode 4 0'.encode('utf-8')]
+        index_path = os.path.join(self.index_dir, 'pageviews-20230101-000000')
+        self.assertEqual(write_hour_index(lines, index_path), 3)
+
+        hour_index = HourIndex(index_path)
+        self.assertEqual(hour_index.lookup('Alpha'), 15)
+        self.assertEqual(hour_index.lookup('Zeta'), 1)
+        self.assertEqual(hour_index.lookup('Ünïcode'), 4)
+        self.assertEqual(hour_index.lookup('Beta'), 0)
+        self.assertEqual(hour_index.lookup('Gamma'), 0)
+        self.assertEqual(hour_index.lookup('Aardvark'), 0)
+
+    def test_count_terms_from_index(self):
+        write_hour_index([b'en Alpha 10 0'], os.path.join(self.index_dir, 'pageviews-20230101-000000'))
+        write_hour_index([b'en Alpha 2 0', b'en Beta 1 0'], os.path.join(self.index_dir, 'pageviews-20230101-010000'))
+        links = ['pageviews-20230101-000000.gz\n', 'pageviews-20230101-010000.gz\n', 'pageviews-20230101-020000.gz\n']
+
+        totals, missing = count_terms_from_index(links, ['Alpha', 'Beta'], self.index_dir)
+        self.assertEqual(totals, {'Alpha': 12, 'Beta': 1})
+        self.assertEqual(missing, ['pageviews-20230101-020000.gz\n'])
+
+        totals, _ = count_terms_from_index(links, ['alpha', 'B'], self.index_dir, match='prefix')
+        self.assertEqual(totals, {'alpha': 12, 'B': 1})
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_generated_dump_is_skewed_and_engines_agree(self):
+        path = os.path.join(self.root, 'pageviews-20230101-000000.gz')
+        generate_dump(path, 20000, title_count=500, malformed_rate=0.05)
+        with gzip.open(path, 'rb') as dump_file:
+            lines = dump_file.read().splitlines()
+        self.assertEqual(len(lines), 20000)
+        self.assertTrue(any(len(line.split()) != 4 for line in lines))
+
+        with open(path, 'rb') as dump_file:
+            data = dump_file.read()
+        blocks = [gzip.decompress(data)]
+        totals = scan_blocks(blocks, ['Main_Page', 'Page_250'])
+        self.assertGreater(totals['Main_Page'], totals['Page_250'])
+        self.assertEqual(scan_blocks(blocks, ['Main_Page', 'Page_250'], engine='pandas'), totals)
+
+    def test_inflate_rates_per_core(self):
+        path = os.path.join(self.root, 'members.gz')
+        generate_dump(path, 3000, title_count=50, member_lines=1000)
+        row = measure_inflate(path, 3)
+        self.assertEqual(row['segments'], 3)
+        self.assertGreater(row['mb_per_second_per_core'], 0)
+
+    def test_dumps_server_serves_listing_and_pipeline(self):
+        links = generate_dumps_directory(self.root, 2, 1000, 50, 0.0)
+        server, base_url = start_dumps_server(self.root)
+        try:
+            self.assertEqual(fetch_month_links(base_url, ['20230101']), links)
+            client = DownloadClient(backoff_seconds=0)
+            totals = run_pipeline(links, base_url, ['Main_Page'], fetch_workers=2, scan_workers=0, client=client)
+            client.close()
+        finally:
+            server.shutdown()
+        self.assertGreater(totals['Main_Page'], 0)
+        self.assertEqual(client.files_downloaded, 2)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,12 +1,54 @@
+import argparse
+import bisect
+import bz2
+import csv
+import hashlib
+import heapq
+import io
+import json
 import logging
+import re
 import gzip
 import shutil
 import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import zlib
 import requests
+import numpy as np
 import pandas as pd
 import mysql.connector
+import mysql.connector.pooling
 from bs4 import BeautifulSoup
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional
+from urllib.parse import unquote, urljoin
+
+try:
+    import yaml
+except ImportError:
+    yaml = None # Only needed for YAML job files
+
+try:
+    import resource
+except ImportError:
+    resource = None # Unix only, peak memory is not reported elsewhere
+
+try:
+    from isal import isal_zlib as fast_zlib
+except ImportError:
+    try:
+        from zlib_ng import zlib_ng as fast_zlib
+    except ImportError:
+        fast_zlib = zlib # Same API, slower inflate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,14 +59,64 @@ except ImportError:
     logging.error('config.py not found or DATABASE_CONFIG/WIKIPEDIA_BASE_URL not defined. Please create config.py with these variables.')
     exit(1)
 
+try:
+    from config import STORAGE_BACKEND
+except ImportError:
+    STORAGE_BACKEND = 'mysql'
+
+try:
+    from config import WIKIPEDIA_DAILY_BASE_URL
+except ImportError:
+    WIKIPEDIA_DAILY_BASE_URL = 'https://dumps.wikimedia.org/other/pageview_complete/'
+
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_FETCH_WORKERS = 2 # dumps.wikimedia.org asks for no more than a few parallel downloads
+DEFAULT_SCAN_WORKERS = os.cpu_count() or 1
+DEFAULT_MAX_CONNECTIONS = 3 # Concurrent connections to dumps.wikimedia.org shared by all downloads and listings
+DEFAULT_MAX_RETRIES = 5
+RATE_LIMIT_BURST_SECONDS = 1.0 # Idle time earns at most this much transfer at full speed under --rate-limit
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_DB_POOL_SIZE = 2
+DEFAULT_DB_BATCH_SIZE = 1000
+DEFAULT_DB_FLUSH_SECONDS = 5.0
+DEFAULT_LISTING_WORKERS = DEFAULT_MAX_CONNECTIONS
+DEFAULT_CACHE_MAX_BYTES = 10 * 1024 ** 3
+DEFAULT_JOURNAL_PATH = 'wiki_crawl_journal.sqlite'
+DEFAULT_FOLLOW_INTERVAL = 600.0 # Hour files appear about once an hour, an unchanged listing costs a 304
+SCAN_ENGINES = ('bytes', 'pandas')
+DEFAULT_PANDAS_MEMORY_MB = 256 # Ceiling on one DataFrame chunk when hour files are read with pandas
+PANDAS_FIRST_CHUNK_BYTES = 4 * 1024 ** 2
+PANDAS_COLUMNS = ['Domain Code', 'Page Title', 'Count Views', 'Response Size']
+PANDAS_SENTINEL_LINE = b'- - 0 0\n'
+MATCH_MODES = ('exact', 'normalized', 'prefix', 'regex')
+TITLE_MEMO_MAX_ENTRIES = 2_000_000 # Distinct raw titles a TitleMatcher remembers; later ones are matched every time
+FOLD_UNSAFE_BYTES = bytes(range(0x20)) + b'%' + bytes(range(0x7f, 0x100)) # Titles fold_ascii_title leaves to normalize_title
+TITLE_MATCHER_CACHE_SIZE = 4 # Matchers (with their memos) kept per process for different term lists
+DEFAULT_TOP_CAPACITY = 200_000 # Title counters kept by the approximate top-N summary, roughly 50-100 MB
+TOP_MODES = ('approximate', 'exact')
+STORAGE_BACKENDS = ('mysql', 'sqlite', 'csv', 'parquet')
+HREF_PATTERN = re.compile(rb'<a\s[^>]*?href="([^"]*)"', re.IGNORECASE)
+DUMP_FILENAME_PATTERN = re.compile(r'pageviews-(\d{8})-(\d{2})\d{4}\.gz')
+DAILY_DUMP_FILENAME_PATTERN = re.compile(r'pageviews-(\d{8})-user\.bz2')
+HOURLY_COUNTS_PATTERN = re.compile(rb'([A-X])(\d+)') # Pageview-complete hours: A is 00:00-00:59, X is 23:00-23:59
+DAILY_PROJECT_SUFFIXES = {b'wikipedia': b'', b'wikibooks': b'.b', b'wiktionary': b'.d', b'wikimedia': b'.m',
+                          b'wikinews': b'.n', b'wikiquote': b'.q', b'wikisource': b'.s', b'wikiversity': b'.v',
+                          b'wikivoyage': b'.voy'}
+SOURCES = ('auto', 'hourly', 'daily')
+PREFILTER_MAX_TERMS = 8
+GZIP_MEMBER_MAGIC = b'\x1f\x8b\x08'
+GZIP_PROBE_BYTES = 4096 # Inflated from a candidate member start to rule out magic bytes inside compressed data
+PARALLEL_INFLATE_SEGMENT_BYTES = 4 * 1024 ** 2 # Compressed bytes per unit of work when members are inflated in parallel
+
 class Wiki:
-    def __init__(self, search_url):
+    def __init__(self, search_url, session: Optional[requests.Session] = None):
         self.search_url = search_url
+        self.session = session
         self.soup = None
 
     def fetch_page(self):
         try:
-            response = requests.get(self.search_url, timeout=10)
+            response = (self.session or requests).get(self.search_url, timeout=10)
             response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
             self.soup = BeautifulSoup(response.text, 'html.parser')
             logging.info(f'Successfully fetched page: {self.search_url}')
@@ -32,12 +124,341 @@ class Wiki:
             logging.error(f'Error fetching URL {self.search_url}: {e}')
             raise
 
+    def fetch_hour_files(self, listing_cache: Optional['ListingCache'] = None) -> list:
+        cached = listing_cache.get(self.search_url) if listing_cache is not None else None
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            response = (self.session or requests).get(self.search_url, headers=headers, timeout=10)
+            if cached is not None and response.status_code == 304:
+                logging.info(f'Listing unchanged, using cached copy: {self.search_url}')
+                return cached['hour_files']
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.error(f'Error fetching URL {self.search_url}: {e}')
+            raise
+        hour_files = [href for href in extract_hrefs(response.content) if parse_dump_filename(href)]
+        logging.info(f'Successfully fetched page: {self.search_url}')
+        if listing_cache is not None:
+            listing_cache.put(self.search_url, response.headers.get('ETag'), response.headers.get('Last-Modified'), hour_files)
+        return hour_files
+
     def find_all_links(self) -> list:
         if not self.soup:
             logging.warning('No soup object available. Call fetch_page() first.')
             return []
         return self.soup.find_all('a')
 
+class ListingCache:
+    # Hour file names parsed from each monthly listing, revalidated with ETag/Last-Modified.
+    # Without a path it only lives as long as the process, e.g. across the polls of a follow run.
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.listings = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as cache_file:
+                self.listings = json.load(cache_file)
+        except (IOError, ValueError):
+            pass
+
+    def get(self, url: str) -> Optional[dict]:
+        with self.lock:
+            return self.listings.get(url)
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], hour_files: list) -> None:
+        if not etag and not last_modified:
+            return # Nothing to revalidate against
+        with self.lock:
+            self.listings[url] = {'etag': etag, 'last_modified': last_modified, 'hour_files': hour_files}
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self.lock:
+            try:
+                with open(self.path + '.tmp', 'w') as cache_file:
+                    json.dump(self.listings, cache_file)
+                os.replace(self.path + '.tmp', self.path)
+            except IOError as e:
+                logging.error(f'Error saving listing cache {self.path}: {e}')
+
+class HourlySource:
+    # A family of pageview dumps: where its monthly listings live and how its files decode into hour-file
+    # lines, 'domain_code page_title count_views response_size', which every scan engine reads
+    name = 'hourly'
+    magic = b'\x1f\x8b'
+    filename_pattern = DUMP_FILENAME_PATTERN
+
+    def __init__(self, base_url: str = WIKIPEDIA_BASE_URL):
+        self.base_url = base_url
+
+    def fetch_links(self, search_dates: list, max_workers: int = DEFAULT_LISTING_WORKERS,
+                    listing_cache: Optional[ListingCache] = None, missing_ok: bool = False) -> list:
+        return fetch_month_links(self.base_url, search_dates, max_workers, listing_cache, self.filename_pattern,
+                                 missing_ok)
+
+    @staticmethod
+    def iter_blocks(chunks: Iterable[bytes], inflate_workers: int = 1) -> Iterator[bytes]:
+        if inflate_workers > 1:
+            return iter_gzip_blocks_parallel(chunks, inflate_workers)
+        return iter_gzip_blocks(chunks)
+
+class DailySource(HourlySource):
+    # Per-day pageview-complete dumps: one bz2 file a day instead of 24 gzip hour files, with one line per
+    # (wiki, title, access method) holding the day's total and its per-hour counts. Links are absolute, so
+    # days missing here can be filled in with hour files from another base URL in the same work list.
+    name = 'daily'
+    magic = b'BZh'
+    filename_pattern = DAILY_DUMP_FILENAME_PATTERN
+
+    def __init__(self, base_url: str = WIKIPEDIA_DAILY_BASE_URL):
+        super().__init__(base_url)
+
+    def fetch_links(self, search_dates: list, max_workers: int = DEFAULT_LISTING_WORKERS,
+                    listing_cache: Optional[ListingCache] = None, missing_ok: bool = False) -> list:
+        return [urljoin(self.base_url, link)
+                for link in super().fetch_links(search_dates, max_workers, listing_cache, missing_ok)]
+
+    @staticmethod
+    def iter_blocks(chunks: Iterable[bytes], inflate_workers: int = 1) -> Iterator[bytes]:
+        return iter_daily_blocks(iter_bz2_blocks(chunks))
+
+class DownloadClient:
+    # One pooled keep-alive session shared by every hour download. Transient failures are retried with
+    # exponential backoff and jitter, and interrupted transfers continue where they stopped via Range.
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_seconds: float = 1.0, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 rate_limit: Optional[float] = None, timeout: float = 30):
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limit = rate_limit # bytes per second over all downloads, None for unlimited
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'wikipedia_data_search (python-requests)'
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.connections = threading.BoundedSemaphore(max_connections)
+        self.lock = threading.Lock()
+        # Token bucket for the rate limit: refills at rate_limit and holds at most RATE_LIMIT_BURST_SECONDS
+        # worth of bytes (or one chunk), so idle time between downloads does not turn into unthrottled credit
+        self.bucket_capacity = max(rate_limit * RATE_LIMIT_BURST_SECONDS, chunk_size) if rate_limit else 0
+        self.bucket_tokens = self.bucket_capacity
+        self.bucket_updated = time.monotonic()
+        self.active_downloads = 0
+        self.active_since = 0.0
+        self.active_seconds = 0.0 # Time with at least one download in flight, for the MB/s in log_stats
+        self.bytes_downloaded = 0
+        self.files_downloaded = 0
+        self.retries = 0
+        self.failed_downloads = 0
+
+    def _is_retryable(self, error: requests.exceptions.RequestException) -> bool:
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is not None and error.response.status_code in RETRY_STATUS_CODES
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                  requests.exceptions.ChunkedEncodingError))
+
+    def _throttle(self, size: int) -> None:
+        delay = 0
+        with self.lock:
+            self.bytes_downloaded += size
+            if self.rate_limit:
+                now = time.monotonic()
+                self.bucket_tokens = min(self.bucket_capacity, self.bucket_tokens + (now - self.bucket_updated) * self.rate_limit)
+                self.bucket_updated = now
+                self.bucket_tokens -= size # May go negative: the debt is slept off here and refilled before anyone else's turn
+                delay = -self.bucket_tokens / self.rate_limit
+        if delay > 0:
+            time.sleep(delay)
+
+    def _set_active(self, starting: bool) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if starting:
+                if self.active_downloads == 0:
+                    self.active_since = now
+                self.active_downloads += 1
+            else:
+                self.active_downloads -= 1
+                if self.active_downloads == 0:
+                    self.active_seconds += now - self.active_since
+
+    def iter_chunks(self, url: str) -> Iterator[bytes]:
+        received = 0
+        attempt = 0
+        while True:
+            headers = {'Range': f'bytes={received}-'} if received else {}
+            try:
+                with self.connections:
+                    self._set_active(True)
+                    try:
+                        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                            response.raise_for_status()
+                            # A server that ignores Range sends the whole file again, so drop what we already have
+                            skip = received if received and response.status_code != 206 else 0
+                            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                                if skip:
+                                    dropped = min(skip, len(chunk))
+                                    chunk = chunk[dropped:]
+                                    skip -= dropped
+                                    if not chunk:
+                                        continue
+                                received += len(chunk)
+                                self._throttle(len(chunk))
+                                yield chunk
+                    finally:
+                        self._set_active(False)
+                with self.lock:
+                    self.files_downloaded += 1
+                return
+            except requests.exceptions.RequestException as e:
+                attempt += 1
+                if attempt > self.max_retries or not self._is_retryable(e):
+                    with self.lock:
+                        self.failed_downloads += 1
+                    raise
+                delay = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+                with self.lock:
+                    self.retries += 1
+                logging.warning(f'Download of {url} failed ({e}), retry {attempt}/{self.max_retries} '
+                                f'from byte {received} in {delay:.1f}s.')
+                time.sleep(delay)
+
+    def fetch(self, url: str) -> bytes:
+        return b''.join(self.iter_chunks(url))
+
+    def log_stats(self) -> None:
+        elapsed = self.active_seconds # Only while downloads were in flight, not waiting for scans or the next poll
+        megabytes = self.bytes_downloaded / 1024 ** 2
+        logging.info(f'Downloaded {self.files_downloaded} hour file(s), {megabytes:.1f} MB in {elapsed:.1f}s '
+                     f'({megabytes / elapsed if elapsed else 0:.2f} MB/s), {self.retries} retry(ies), '
+                     f'{self.failed_downloads} dropped hour(s).')
+
+    def close(self) -> None:
+        self.session.close()
+
+class RunMetrics:
+    # Per-stage timings and counters for one run, summed over all hours and kept per hour. Updated
+    # from the fetch threads and from the stats the scan processes return with their results.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.stages = {}
+        self.hours = {}
+
+    def add(self, stage: str, seconds: float = 0.0, link: Optional[str] = None, **counters) -> None:
+        with self.lock:
+            totals = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+            if link is not None:
+                hour = self.hours.setdefault(link.split('/')[-1].strip(), {})
+                hour[f'{stage}_seconds'] = hour.get(f'{stage}_seconds', 0.0) + seconds
+                for name, value in counters.items():
+                    hour[f'{stage}_{name}'] = hour.get(f'{stage}_{name}', 0) + value
+
+    def record_scan(self, link: str, stats: dict) -> None:
+        # Time spent producing chunks is the download when streaming, inflating them is the decompression,
+        # and whatever is left of the hour's total went to scanning
+        if stats.get('queued_seconds') is not None:
+            self.add('scan_queue_wait', stats['queued_seconds'], link)
+        if stats.get('streamed'):
+            self.add('download', stats['download_seconds'], link, bytes=stats['download_bytes'])
+        self.add('decompress', stats['inflate_seconds'] - stats['download_seconds'], link, bytes=stats['inflate_bytes'])
+        self.add('scan', stats['total_seconds'] - stats['inflate_seconds'], link, lines=stats['lines'])
+
+    def peak_memory_mb(self) -> dict:
+        if resource is None:
+            return {}
+        # ru_maxrss is in kilobytes on Linux; children are the scan processes that have exited
+        return {'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+    def summary(self, include_hours: bool = True) -> dict:
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            stages = {stage: {name: round(value, 3) if isinstance(value, float) else value for name, value in totals.items()}
+                      for stage, totals in self.stages.items()}
+            hours = {hour: {name: round(value, 3) if isinstance(value, float) else value for name, value in values.items()}
+                     for hour, values in self.hours.items()}
+        for totals in stages.values():
+            if totals['seconds'] > 0 and 'bytes' in totals:
+                totals['mb_per_second'] = round(totals['bytes'] / 1024 ** 2 / totals['seconds'], 2)
+            if totals['seconds'] > 0 and 'lines' in totals:
+                totals['lines_per_second'] = round(totals['lines'] / totals['seconds'])
+        summary = {
+            'elapsed_seconds': round(elapsed, 3),
+            'hours': len(hours),
+            'hours_per_minute': round(len(hours) / elapsed * 60, 2) if elapsed else 0,
+            'peak_memory_mb': self.peak_memory_mb(),
+            'stages': stages,
+        }
+        if include_hours:
+            summary['per_hour'] = hours
+        return summary
+
+    def prometheus_text(self, prefix: str = 'wiki_crawl') -> str:
+        # Text exposition format, e.g. for node_exporter's textfile collector
+        summary = self.summary(include_hours=False)
+        samples = {f'{prefix}_elapsed_seconds': [('', summary['elapsed_seconds'])],
+                   f'{prefix}_hours_total': [('', summary['hours'])]}
+        for process, megabytes in summary['peak_memory_mb'].items():
+            samples.setdefault(f'{prefix}_peak_memory_bytes', []).append((f'{{process="{process}"}}', int(megabytes * 1024 ** 2)))
+        for stage, totals in summary['stages'].items():
+            for name, value in totals.items():
+                samples.setdefault(f'{prefix}_stage_{name}', []).append((f'{{stage="{stage}"}}', value))
+        lines = []
+        for metric, values in samples.items():
+            lines.append(f'# TYPE {metric} gauge')
+            lines.extend(f'{metric}{labels} {value}' for labels, value in values)
+        return '\n'.join(lines) + '\n'
+
+    def statsd_lines(self, prefix: str = 'wiki_crawl') -> list:
+        summary = self.summary(include_hours=False)
+        lines = [f'{prefix}.elapsed_seconds:{summary["elapsed_seconds"]}|g', f'{prefix}.hours:{summary["hours"]}|g']
+        lines.extend(f'{prefix}.peak_memory_mb.{process}:{megabytes}|g' for process, megabytes in summary['peak_memory_mb'].items())
+        for stage, totals in summary['stages'].items():
+            lines.extend(f'{prefix}.{stage}.{name}:{value}|g' for name, value in totals.items())
+        return lines
+
+    def send_statsd(self, address: str, prefix: str = 'wiki_crawl') -> None:
+        host, _, port = address.rpartition(':')
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for line in self.statsd_lines(prefix):
+                sock.sendto(line.encode('utf-8'), (host or 'localhost', int(port)))
+
+class BatchJob:
+    # One (date range, terms) search of a job file; collects its totals from shared per-domain hour results
+    def __init__(self, name: str, start_date: date, end_date: date, search_terms: list,
+                 domains: Optional[list] = None, by_domain: bool = False):
+        self.name = name
+        self.search_dates = get_date_range_span(start_date, end_date)
+        self.dates = set(self.search_dates)
+        self.search_terms = list(search_terms)
+        self.domains = set(domains) if domains else None
+        self.by_domain = by_domain
+        self.totals = {term: {} for term in self.search_terms}
+
+    def record(self, link: str, hourly_views: dict) -> None:
+        if parse_dump_filename(link.split('/')[-1].strip())[0] not in self.dates:
+            return
+        for term in self.search_terms:
+            views_by_domain = hourly_views.get(term, {})
+            if self.domains is not None:
+                views_by_domain = {domain: views for domain, views in views_by_domain.items() if domain in self.domains}
+            self.totals[term] = merge_views(self.totals[term], views_by_domain)
+
 class DataBase:
     def __init__(self):
         self.mydb = None
@@ -75,6 +496,502 @@ class DataBase:
             self.mydb.close()
             logging.info('Database connection closed.')
 
+class ResultStore:
+    # Storage interface for search results. Rows are buffered per table and handed to write() in
+    # batches; backends only implement write() and, if needed, close().
+    TABLE_COLUMNS = {
+        'games': ('game_title', 'total_searches', 'search_dates'),
+        'game_domains': ('game_title', 'domain_code', 'total_searches', 'search_dates'),
+        'game_hourly_views': ('game_title', 'view_hour', 'total_searches'),
+    }
+    TABLE_KEYS = {
+        'games': ('game_title', 'search_dates'),
+        'game_domains': ('game_title', 'domain_code', 'search_dates'),
+        'game_hourly_views': ('game_title', 'view_hour'),
+    }
+    name = 'storage'
+
+    def __init__(self, batch_size: int = DEFAULT_DB_BATCH_SIZE, flush_seconds: float = DEFAULT_DB_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending = {table: [] for table in self.TABLE_COLUMNS}
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+        self.write_seconds = 0.0
+
+    def __enter__(self) -> 'ResultStore':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif any(self.pending.values()):
+            logging.warning(f'Discarding {sum(len(rows) for rows in self.pending.values())} unwritten row(s) after an error.')
+
+    def _add(self, table: str, rows: list) -> None:
+        self.pending[table].extend(rows)
+        if sum(len(rows) for rows in self.pending.values()) >= self.batch_size or \
+                time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def store_data(self, searching_term, search_total, dates_searched) -> None:
+        self._add('games', [(searching_term, int(search_total), dates_searched)])
+
+    def store_batch(self, search_totals: dict, dates_searched: str) -> None:
+        self._add('games', [(term, int(total), dates_searched) for term, total in search_totals.items()])
+
+    def store_domain_breakdown(self, domain_totals: dict, dates_searched: str) -> None:
+        self._add('game_domains', [(term, domain, int(total), dates_searched)
+                                   for term, totals_by_domain in domain_totals.items() for domain, total in totals_by_domain.items()])
+
+    def store_hourly(self, result: 'SearchResult') -> None:
+        self._add('game_hourly_views', result.hourly_rows())
+
+    def write(self, pending: dict) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if not any(self.pending.values()):
+            return
+        started = time.monotonic()
+        self.write({table: rows for table, rows in self.pending.items() if rows})
+        self.write_seconds += time.monotonic() - started
+        written = sum(len(rows) for rows in self.pending.values())
+        self.rows_written += written
+        self.pending = {table: [] for table in self.TABLE_COLUMNS}
+        logging.info(f'Successfully stored {written} row(s).')
+
+    def close(self) -> None:
+        self.flush()
+        if self.rows_written:
+            logging.info(f'{self.name} wrote {self.rows_written} row(s) in {self.write_seconds:.3f}s '
+                         f'({self.rows_written / max(self.write_seconds, 1e-9):.0f} rows/s).')
+
+class DataBaseWriter(ResultStore):
+    # Writes with multi-row upserts over pooled MySQL connections, one commit per flush. Rows for the
+    # same title and date range replace the stored totals, which needs unique keys on the TABLE_KEYS.
+    UPSERTS = {
+        'games': '''INSERT INTO games (game_title,
+                                       total_searches,
+                                       search_dates)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE total_searches = VALUES(total_searches)''',
+        'game_domains': '''INSERT INTO game_domains (game_title,
+                                                     domain_code,
+                                                     total_searches,
+                                                     search_dates)
+                           VALUES (%s, %s, %s, %s)
+                           ON DUPLICATE KEY UPDATE total_searches = VALUES(total_searches)''',
+        'game_hourly_views': '''INSERT INTO game_hourly_views (game_title,
+                                                               view_hour,
+                                                               total_searches)
+                                VALUES (%s, %s, %s)
+                                ON DUPLICATE KEY UPDATE total_searches = VALUES(total_searches)''',
+    }
+    pools = {}
+    name = 'MySQL'
+
+    def __init__(self, batch_size: int = DEFAULT_DB_BATCH_SIZE, flush_seconds: float = DEFAULT_DB_FLUSH_SECONDS,
+                 pool_size: int = DEFAULT_DB_POOL_SIZE):
+        super().__init__(batch_size, flush_seconds)
+        try:
+            # Pools are kept per process, so writers created later reuse the open connections
+            if pool_size not in DataBaseWriter.pools:
+                DataBaseWriter.pools[pool_size] = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name=f'wiki_crawl_{pool_size}', pool_size=pool_size, **DATABASE_CONFIG)
+            self.pool = DataBaseWriter.pools[pool_size]
+        except mysql.connector.Error as err:
+            logging.error(f'Error connecting to database: {err}')
+            raise
+
+    def write(self, pending: dict) -> None:
+        connection = self.pool.get_connection()
+        cursor = connection.cursor()
+        try:
+            for table, rows in pending.items():
+                for start in range(0, len(rows), self.batch_size):
+                    cursor.executemany(self.UPSERTS[table], rows[start:start + self.batch_size])
+            connection.commit()
+        except mysql.connector.Error as err:
+            logging.error(f'Error storing data: {err}')
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close() # Returns the connection to the pool
+
+class SQLiteStore(ResultStore):
+    # Embedded backend for running without a database server: WAL mode, one transaction per flush
+    name = 'SQLite'
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_DB_BATCH_SIZE, flush_seconds: float = DEFAULT_DB_FLUSH_SECONDS):
+        super().__init__(batch_size, flush_seconds)
+        self.path = path
+        try:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            for table, columns in self.TABLE_COLUMNS.items():
+                column_defs = [f'{column} INTEGER' if column == 'total_searches' else f'{column} TEXT' for column in columns]
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(column_defs)}, '
+                                        f'PRIMARY KEY ({", ".join(self.TABLE_KEYS[table])}))')
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logging.error(f'Error opening SQLite store {path}: {e}')
+            raise
+
+    def write(self, pending: dict) -> None:
+        try:
+            with self.connection: # Commits once, or rolls back on error
+                for table, rows in pending.items():
+                    columns = self.TABLE_COLUMNS[table]
+                    sql = (f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+                           f'ON CONFLICT ({", ".join(self.TABLE_KEYS[table])}) DO UPDATE SET total_searches = excluded.total_searches')
+                    self.connection.executemany(sql, [tuple(plain_value(value) for value in row) for row in rows])
+        except sqlite3.Error as e:
+            logging.error(f'Error storing data: {e}')
+            raise
+
+    def close(self) -> None:
+        super().close()
+        self.connection.close()
+
+class FileStore(ResultStore):
+    # Append-only CSV files, or one Parquet part file per flush, for each table in a directory
+    def __init__(self, directory: str, file_format: str = 'csv', batch_size: int = DEFAULT_DB_BATCH_SIZE,
+                 flush_seconds: float = DEFAULT_DB_FLUSH_SECONDS):
+        super().__init__(batch_size, flush_seconds)
+        self.directory = directory
+        self.file_format = file_format
+        self.name = file_format.capitalize()
+        self.parts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, pending: dict) -> None:
+        self.parts += 1
+        for table, rows in pending.items():
+            frame = pd.DataFrame([tuple(plain_value(value) for value in row) for row in rows], columns=self.TABLE_COLUMNS[table])
+            try:
+                if self.file_format == 'parquet':
+                    part_name = f'{table}-{datetime.now():%Y%m%d%H%M%S}-{os.getpid()}-{self.parts:05d}.parquet'
+                    frame.to_parquet(os.path.join(self.directory, part_name), index=False)
+                else:
+                    path = os.path.join(self.directory, f'{table}.csv')
+                    frame.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+            except (IOError, ImportError) as e:
+                logging.error(f'Error storing data in {self.directory}: {e}')
+                raise
+
+def plain_value(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else value
+
+def open_store(backend: str = 'mysql', path: Optional[str] = None, batch_size: int = DEFAULT_DB_BATCH_SIZE,
+               flush_seconds: float = DEFAULT_DB_FLUSH_SECONDS) -> ResultStore:
+    if backend == 'mysql':
+        return DataBaseWriter(batch_size, flush_seconds)
+    if backend == 'sqlite':
+        return SQLiteStore(path or 'wiki_crawl_results.sqlite', batch_size, flush_seconds)
+    if backend in ('csv', 'parquet'):
+        return FileStore(path or 'wiki_crawl_results', backend, batch_size, flush_seconds)
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+class DumpCache:
+    # Hour files never change once published, so they are keyed by file name and checked against
+    # the size and SHA-256 recorded when they were stored
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, 'r') as index_file:
+                self.index = json.load(index_file)
+        except (IOError, ValueError):
+            self.index = {}
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(tmp_path, self.index_path)
+
+    def _remove(self, filename: str) -> None:
+        self.index.pop(filename, None)
+        try:
+            os.remove(os.path.join(self.cache_dir, filename))
+        except OSError:
+            pass
+
+    def get(self, filename: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.index.get(filename)
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                with open(os.path.join(self.cache_dir, filename), 'rb') as cached_file:
+                    data = cached_file.read()
+            except IOError:
+                data = None
+            if data is None or len(data) != entry['size'] or hashlib.sha256(data).hexdigest() != entry['sha256']:
+                logging.warning(f'Cached copy of {filename} is missing or corrupt, discarding it.')
+                self._remove(filename)
+                self._save_index()
+                self.misses += 1
+                return None
+            entry['last_used'] = time.time()
+            self._save_index()
+            self.hits += 1
+            self.bytes_saved += len(data)
+            return data
+
+    def put(self, filename: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                with open(path + '.tmp', 'wb') as cached_file:
+                    cached_file.write(data)
+                os.replace(path + '.tmp', path)
+            except IOError as e:
+                logging.error(f'Error caching {filename}: {e}')
+                return
+            self.index[filename] = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(), 'last_used': time.time()}
+            # Evict least recently used files until the cache fits its budget again
+            used_bytes = sum(entry['size'] for entry in self.index.values())
+            for old_filename in sorted(self.index, key=lambda name: self.index[name]['last_used']):
+                if used_bytes <= self.max_bytes:
+                    break
+                if old_filename != filename:
+                    used_bytes -= self.index[old_filename]['size']
+                    self._remove(old_filename)
+                    logging.info(f'Evicted {old_filename} from the dump cache.')
+            self._save_index()
+
+    def log_stats(self) -> None:
+        logging.info(f'Dump cache: {self.hits} hit(s), {self.misses} miss(es), {self.bytes_saved} bytes not downloaded.')
+
+class HourIndex:
+    # Page titles of one hour file sorted and concatenated into a byte blob, with per-title view
+    # counts summed over all domain codes. Arrays are memory-mapped so opening an index is cheap.
+    def __init__(self, path: str):
+        self.path = path
+        self.titles = np.load(os.path.join(path, 'titles.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.views = np.load(os.path.join(path, 'views.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.views)
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.titles[self.offsets[position]:self.offsets[position + 1]].tobytes()
+
+    def lookup(self, title: str) -> int:
+        key = title.encode('utf-8')
+        position = bisect.bisect_left(self, key)
+        if position < len(self) and self[position] == key:
+            return int(self.views[position])
+        return 0
+
+    def match_views(self, matcher: 'TitleMatcher') -> dict:
+        # Normalized titles don't follow the index's sort order, so each distinct title is matched once instead
+        titles = self.titles.tobytes()
+        offsets = self.offsets.tolist()
+        views = self.views.tolist()
+        views_by_term = dict.fromkeys(matcher.search_terms, 0)
+        for position, view_count in enumerate(views):
+            for term in matcher(titles[offsets[position]:offsets[position + 1]]):
+                views_by_term[term] += view_count
+        return views_by_term
+
+class TitleMatcher:
+    # Maps raw dump titles to the search terms they match after normalization. Every distinct title is
+    # normalized and matched once and then remembered, so a repeated title costs one dict probe, as in
+    # an exact match, however many terms or patterns there are.
+    def __init__(self, search_terms: Iterable[str], match: str = 'normalized'):
+        if match not in MATCH_MODES[1:]:
+            raise ValueError(f'Unknown match mode: {match}')
+        self.search_terms = list(search_terms)
+        self.match = match
+        self.memo = {}
+        if match == 'regex':
+            self.patterns = [(re.compile(term, re.IGNORECASE), term) for term in self.search_terms]
+            # One combined search rules out most titles before the patterns are tried one by one
+            try:
+                self.any_pattern = re.compile('|'.join(f'(?:{term})' for term in self.search_terms), re.IGNORECASE)
+            except re.error:
+                self.any_pattern = None # e.g. backreferences, whose group numbers shift once combined
+        else:
+            self.targets = {}
+            for term in self.search_terms:
+                self.targets.setdefault(normalize_title(term), []).append(term)
+            self.prefix_lengths = sorted({len(target) for target in self.targets}) if match == 'prefix' else []
+
+    def match_title(self, title: str) -> tuple:
+        return self.match_normalized(normalize_title(title))
+
+    def match_normalized(self, normalized: str) -> tuple:
+        if self.match == 'regex':
+            if self.any_pattern is not None and not self.any_pattern.search(normalized):
+                return ()
+            return tuple(term for pattern, term in self.patterns if pattern.search(normalized))
+        if self.match == 'prefix':
+            return tuple(term for length in self.prefix_lengths for term in self.targets.get(normalized[:length], ()))
+        return tuple(self.targets.get(normalized, ()))
+
+    def __call__(self, raw_title: bytes) -> tuple:
+        terms = self.memo.get(raw_title)
+        if terms is None:
+            folded = fold_ascii_title(raw_title)
+            if folded is None:
+                terms = self.match_title(raw_title.decode('utf-8', 'replace'))
+            else:
+                terms = self.match_normalized(folded)
+            # A full memo is kept rather than cleared: hours are scanned in the same title order, so the
+            # titles it holds keep hitting, and the rest are mostly folded on the bytes above
+            if len(self.memo) < TITLE_MEMO_MAX_ENTRIES:
+                self.memo[raw_title] = terms
+        return terms
+
+@lru_cache(maxsize=TITLE_MATCHER_CACHE_SIZE)
+def get_title_matcher(search_terms: tuple, match: str) -> TitleMatcher:
+    # One matcher per term list and mode for the whole process, so the memo carries over from hour to
+    # hour: titles repeat across hours and only the few new ones each hour go through the matcher.
+    # Scan processes are reused between hours, so each keeps its own.
+    return TitleMatcher(search_terms, match)
+
+class TopTitles:
+    # Views per page title over many hours, for finding the most viewed pages. Without a capacity every
+    # title is counted exactly. With one it is a mergeable Space-Saving style summary: counters are
+    # summed, and once there are twice `capacity` of them only the `capacity` largest survive. A kept
+    # count falls short of the title's true total by at most max_error, the sum of the pruned cut-offs.
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self.counts = {}
+        self.max_error = 0
+
+    def prune(self) -> None:
+        if self.capacity is None or len(self.counts) <= 2 * self.capacity:
+            return
+        ranked = heapq.nlargest(self.capacity + 1, self.counts.items(), key=itemgetter(1))
+        self.max_error += ranked[-1][1]
+        self.counts = dict(ranked[:-1])
+
+    def merge(self, other: 'TopTitles') -> 'TopTitles':
+        # The merged dict keeps one key object per title, however many hours it shows up in
+        counts = self.counts
+        for title, views in other.counts.items():
+            counts[title] = counts.get(title, 0) + views
+        self.max_error += other.max_error
+        self.prune()
+        return self
+
+    def top(self, top_n: int) -> dict:
+        return {title.decode('utf-8', 'replace'): int(views)
+                for title, views in heapq.nlargest(top_n, self.counts.items(), key=itemgetter(1))}
+
+class SearchResult:
+    # Per-hour view counts for every search term, one row per term and one column per hour file
+    def __init__(self, search_terms: list, hours: list):
+        self.search_terms = list(search_terms)
+        self.hours = list(hours)
+        self.term_rows = {term: row for row, term in enumerate(self.search_terms)}
+        self.hour_columns = {hour: column for column, hour in enumerate(self.hours)}
+        self.views = np.zeros((len(self.search_terms), len(self.hours)), dtype=np.int64)
+        self.completed = np.zeros(len(self.hours), dtype=bool)
+
+    @classmethod
+    def from_links(cls, search_terms: list, links: list) -> 'SearchResult':
+        return cls(search_terms, [parse_hour(link) for link in links])
+
+    def record(self, link: str, hourly_views: dict) -> None:
+        column = self.hour_columns[parse_hour(link)]
+        for term, views in collapse_domains(hourly_views).items():
+            self.views[self.term_rows[term], column] = views
+        self.completed[column] = True
+
+    def totals(self) -> dict:
+        return {term: int(views) for term, views in zip(self.search_terms, self.views.sum(axis=1))}
+
+    def to_frame(self, freq: str = 'h') -> pd.DataFrame:
+        hours = [hour for hour, done in zip(self.hours, self.completed) if done]
+        frame = pd.DataFrame({
+            'term': np.repeat(self.search_terms, len(hours)),
+            'hour': np.tile(np.array(hours, dtype='datetime64[s]'), len(self.search_terms)),
+            'views': self.views[:, self.completed].ravel(),
+        })
+        if freq != 'h':
+            frame = frame.groupby(['term', pd.Grouper(key='hour', freq=freq)], sort=False)['views'].sum().reset_index()
+        return frame
+
+    def hourly_rows(self) -> list:
+        return [(term, hour.to_pydatetime(), int(views)) for term, hour, views in self.to_frame().itertuples(index=False)]
+
+    def export(self, path: str, freq: str = 'h') -> None:
+        frame = self.to_frame(freq)
+        try:
+            if path.endswith('.parquet'):
+                frame.to_parquet(path, index=False) # Needs pyarrow or fastparquet
+            else:
+                frame.to_csv(path, index=False)
+            logging.info(f'Exported {len(frame)} rows to {path}')
+        except (IOError, ImportError) as e:
+            logging.error(f'Error exporting results to {path}: {e}')
+            raise
+
+class CrawlJournal:
+    # SQLite checkpoint of the hour files a job has finished, with their per-hour views, so an
+    # interrupted crawl can be resumed without downloading those hours again
+    def __init__(self, path: str, search_terms: list, domains: Optional[list] = None, by_domain: bool = False,
+                 match: str = 'exact'):
+        self.path = path
+        job = {'terms': sorted(search_terms), 'domains': sorted(domains or []), 'by_domain': by_domain}
+        if match != 'exact':
+            job['match'] = match # Left out for exact matches so journals from before --match still resume
+        self.job_key = hashlib.sha1(json.dumps(job).encode('utf-8')).hexdigest()
+        try:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS completed_hours (job_key TEXT NOT NULL,
+                                                                               hour_file TEXT NOT NULL,
+                                                                               hourly_views TEXT NOT NULL,
+                                                                               PRIMARY KEY (job_key, hour_file))''')
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logging.error(f'Error opening crawl journal {path}: {e}')
+            raise
+
+    def completed_hours(self) -> dict:
+        rows = self.connection.execute('SELECT hour_file, hourly_views FROM completed_hours WHERE job_key = ?', (self.job_key,))
+        return {hour_file: json.loads(hourly_views) for hour_file, hourly_views in rows}
+
+    def record(self, link: str, hourly_views: dict) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO completed_hours VALUES (?, ?, ?)',
+                                (self.job_key, link.split('/')[-1].strip(), json.dumps(hourly_views)))
+        self.connection.commit()
+
+    def reset(self) -> None:
+        self.connection.execute('DELETE FROM completed_hours WHERE job_key = ?', (self.job_key,))
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+class HourRecorders:
+    # Passes each finished hour on to several recorders, e.g. a SearchResult and a CrawlJournal
+    def __init__(self, *recorders):
+        self.recorders = [recorder for recorder in recorders if recorder is not None]
+
+    def record(self, link: str, hourly_views: dict) -> None:
+        for recorder in self.recorders:
+            recorder.record(link, hourly_views)
+
 def format_url(url_base: str, format_year: str, format_month: str) -> str:
     return f'{url_base}{format_year}/{format_year}-{format_month}/'
 
@@ -110,12 +1027,117 @@ def validate_date_input(year_str: str, month_str: str, start_day_str: str, end_d
         logging.error(f'Invalid date input: {e}')
         raise
 
+def validate_date_range(start_str: str, end_str: str) -> tuple:
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+
+        if start_date.year < 2015 or end_date.year > datetime.now().year:
+            raise ValueError('Dates must be between year 2015 and current year.')
+        if start_date > end_date:
+            raise ValueError('Start date cannot be after end date.')
+
+        return start_date, end_date
+    except ValueError as e:
+        logging.error(f'Invalid date input: {e}')
+        raise
+
+def get_date_range_span(start_date: date, end_date: date) -> list:
+    return [(start_date + timedelta(days=offset)).strftime('%Y%m%d') for offset in range((end_date - start_date).days + 1)]
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date() # Dump file names are in UTC
+
 def get_search_span(year: int, month: int, start_day: int, end_day: int) -> list:
     list_of_dates = []
     for day in range(start_day, end_day + 1):
         list_of_dates.append(f'{year}{month:02d}{day:02d}')
     return list_of_dates
 
+def extract_hrefs(html: bytes) -> list:
+    return [match.decode('utf-8', 'replace') for match in HREF_PATTERN.findall(html)]
+
+def parse_dump_filename(filename: str) -> Optional[tuple]:
+    # (YYYYMMDD, HH) for hour files and (YYYYMMDD, '') for daily files, which sort before that day's hours
+    match = DUMP_FILENAME_PATTERN.fullmatch(filename)
+    if match:
+        return match.groups()
+    match = DAILY_DUMP_FILENAME_PATTERN.fullmatch(filename)
+    return (match.group(1), '') if match else None
+
+def link_sort_key(link: str) -> tuple:
+    return parse_dump_filename(link.split('/')[-1].strip())
+
+def fetch_month_links(url_base: str, search_dates: list, max_workers: int = DEFAULT_LISTING_WORKERS,
+                      listing_cache: Optional[ListingCache] = None, filename_pattern: re.Pattern = DUMP_FILENAME_PATTERN,
+                      missing_ok: bool = False) -> list:
+    # Links are returned relative to url_base, e.g. '2023/2023-11/pageviews-20231115-000000.gz',
+    # so hour files from several monthly listings share one ordered work list. With missing_ok a month
+    # whose listing can't be fetched is left out instead of failing the others.
+    wanted_dates = set(search_dates)
+    months = sorted({(day[:4], day[4:6]) for day in search_dates})
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        wikis = [Wiki(format_url(url_base, year, month), session) for year, month in months]
+        def fetch_hour_files(wiki: Wiki) -> list:
+            try:
+                return wiki.fetch_hour_files(listing_cache)
+            except requests.exceptions.RequestException as e:
+                if not missing_ok:
+                    raise
+                logging.warning(f'Could not list {wiki.search_url}, its days are left out: {e}')
+                return []
+        with ThreadPoolExecutor(max_workers) as pool:
+            month_hour_files = list(pool.map(fetch_hour_files, wikis))
+
+    links = []
+    for (year, month), hour_files in zip(months, month_hour_files):
+        for filename in hour_files:
+            if filename_pattern.fullmatch(filename) and parse_dump_filename(filename)[0] in wanted_dates:
+                links.append(f'{year}/{year}-{month}/{filename}')
+    return sorted(links, key=link_sort_key)
+
+def fetch_source_links(source: str, search_dates: list, max_workers: int = DEFAULT_LISTING_WORKERS,
+                       listing_cache: Optional[ListingCache] = None, hourly_url: str = WIKIPEDIA_BASE_URL,
+                       daily_url: str = WIKIPEDIA_DAILY_BASE_URL) -> list:
+    # 'auto' reads whole days from daily files, 24x fewer downloads, and falls back to hour files for days
+    # the daily dumps do not have yet; they are published a day or so after the last hour of the day. A month
+    # whose daily listing is missing, e.g. early in the month, only sends that month's days to hour files.
+    hourly_source = HourlySource(hourly_url)
+    if source == 'hourly':
+        return hourly_source.fetch_links(search_dates, max_workers, listing_cache)
+    links = DailySource(daily_url).fetch_links(search_dates, max_workers, listing_cache, missing_ok=source == 'auto')
+    if source == 'daily':
+        return links
+
+    daily_dates = {link_sort_key(link)[0] for link in links}
+    missing_dates = [day for day in search_dates if day not in daily_dates]
+    if missing_dates:
+        logging.info(f'{len(missing_dates)} day(s) have no daily file yet and are read from hour files.')
+        links += hourly_source.fetch_links(missing_dates, max_workers, listing_cache)
+    return sorted(links, key=link_sort_key)
+
+def poll_new_links(url_base: str, start_day: str, seen_hour_files: set, backfill: bool = False,
+                   max_workers: int = DEFAULT_LISTING_WORKERS, listing_cache: Optional[ListingCache] = None) -> tuple:
+    # Links to hour files from start_day on that are not in seen_hour_files, and whether every listing
+    # could be fetched. After the backfill only today's and yesterday's months are listed, since the last
+    # hours of a month are published after midnight; with the listing cache an unchanged month is a 304.
+    today = utc_today()
+    first_day = datetime.strptime(start_day, '%Y%m%d').date()
+    if not backfill:
+        first_day = max(first_day, today - timedelta(days=1))
+    links = []
+    listed = True
+    for month, days in groupby(get_date_range_span(first_day, today), key=lambda day: day[:6]):
+        try:
+            links += fetch_month_links(url_base, list(days), max_workers, listing_cache)
+        except requests.exceptions.RequestException as e:
+            logging.warning(f'Could not list the hour files of {month}, trying again on the next poll: {e}')
+            listed = False
+    return [link for link in links if link.split('/')[-1].strip() not in seen_hour_files], listed
+
 def display_search_dates(search_range: list) -> str:
     if not search_range:
         return 'No dates to display.'
@@ -143,6 +1165,7 @@ def write_links_to_file(wiki_links: list, search_dates: list, filename: str = 'w
 def unzip_file(file_name: str) -> str:
     output_filename = f'{file_name}.txt'
     try:
+        # The disk path is the unchanged reference, so it keeps the standard library's gzip
         with gzip.open(file_name, 'rb') as file_in:
             with open(output_filename, 'wb') as file_out:
                 shutil.copyfileobj(file_in, file_out)
@@ -152,16 +1175,27 @@ def unzip_file(file_name: str) -> str:
         logging.error(f'Error unzipping file {file_name}: {e}')
         raise
 
-def search_file(text_file: str, searching_term: str, current_total_searches: int) -> int:
+def search_file(text_file: str, searching_term: str, current_total_searches: int,
+                max_memory_mb: Optional[float] = None) -> int:
     try:
-        file_df = pd.read_csv(text_file, sep=' ', header=None, on_bad_lines='skip')
-        file_df.columns = ['Domain Code', 'Page Title', 'Count Views', 'Response Size']
+        if max_memory_mb is not None:
+            # Partial sums per chunk, so only about max_memory_mb of the file is in memory at once
+            with open(text_file, 'rb') as file_in:
+                blocks = iter(lambda: file_in.read(STREAM_CHUNK_SIZE), b'')
+                hourly_views = sum(int(chunk.loc[chunk['Page Title'] == searching_term, 'Count Views'].sum())
+                                   for chunk in read_pageview_chunks(blocks, max_memory_mb))
+        else:
+            # Quotes are ordinary title characters; pandas' default would read from a '"' to the next one across lines.
+            # Titles such as NULL or NA are real pages, not missing values.
+            file_df = pd.read_csv(text_file, sep=' ', header=None, on_bad_lines='skip', quoting=csv.QUOTE_NONE,
+                                  keep_default_na=False)
+            file_df.columns = ['Domain Code', 'Page Title', 'Count Views', 'Response Size']
 
-        # Ensure 'Count Views' is numeric, coercing errors to NaN
-        file_df['Count Views'] = pd.to_numeric(file_df['Count Views'], errors='coerce')
-        file_df.dropna(subset=['Count Views'], inplace=True) # Drop rows where conversion failed
+            # Ensure 'Count Views' is numeric, coercing errors to NaN
+            file_df['Count Views'] = pd.to_numeric(file_df['Count Views'], errors='coerce')
+            file_df.dropna(subset=['Count Views'], inplace=True) # Drop rows where conversion failed
 
-        hourly_views = file_df[file_df['Page Title'] == searching_term]['Count Views'].sum()
+            hourly_views = file_df[file_df['Page Title'] == searching_term]['Count Views'].sum()
         new_total_searches = current_total_searches + hourly_views
 
         logging.info(f'"{searching_term}" has been searched on Wikipedia {int(hourly_views)} times this hour.')
@@ -177,6 +1211,496 @@ def search_file(text_file: str, searching_term: str, current_total_searches: int
         logging.error(f'Error searching file {text_file}: {e}')
         return current_total_searches
 
+def parse_pageviews(pieces: list) -> pd.DataFrame:
+    # Categorical Domain Code and int32 Count Views; Response Size is read as a category (a byte per row)
+    # and dropped, because pruning it with usecols makes pandas stop skipping lines with extra fields.
+    # A well-formed first line keeps pandas from taking a malformed one as an index column (and from
+    # failing on empty input). Titles may start or end with '"', so quoting is off, as in the byte engine,
+    # and titles such as NULL, NA or NaN are kept as text instead of becoming missing values.
+    file_df = pd.read_csv(io.BytesIO(b''.join([PANDAS_SENTINEL_LINE, *pieces])), sep=' ', header=None,
+                          on_bad_lines='skip', names=PANDAS_COLUMNS, quoting=csv.QUOTE_NONE, keep_default_na=False,
+                          dtype={'Domain Code': 'category', 'Page Title': object, 'Response Size': 'category'}).iloc[1:]
+    # Counts are parsed as integers unless the chunk has malformed ones, which become NaN here
+    counts = pd.to_numeric(file_df['Count Views'], errors='coerce')
+    valid = counts.notna()
+    counts = counts[valid]
+    # A count past the int32 range would wrap around, so such a (rare) chunk keeps int64 counts
+    int32_range = np.iinfo(np.int32)
+    fits_int32 = counts.empty or (counts.min() >= int32_range.min and counts.max() <= int32_range.max)
+    return pd.DataFrame({'Domain Code': file_df['Domain Code'][valid], 'Page Title': file_df['Page Title'][valid],
+                         'Count Views': counts.astype(np.int32 if fits_int32 else np.int64)})
+
+def read_pageview_chunks(blocks: Iterable[bytes], max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> Iterator[pd.DataFrame]:
+    # Parses an hour file as DataFrames of about max_memory_mb each, or all at once for None. Chunks are
+    # cut at line breaks and parsed separately: pandas' own chunked reader stops skipping lines with
+    # extra fields at chunk boundaries.
+    chunk_bytes = PANDAS_FIRST_CHUNK_BYTES if max_memory_mb is not None else None
+    first_chunk = True
+    pending = []
+    pending_size = 0
+    for block in blocks:
+        pending.append(block)
+        pending_size += len(block)
+        if chunk_bytes is None or pending_size < chunk_bytes:
+            continue
+        text = b''.join(pending)
+        cut = text.rfind(b'\n') + 1
+        pending = [text[cut:]]
+        pending_size = len(pending[0])
+        chunk = parse_pageviews([memoryview(text)[:cut]])
+        if first_chunk and cut:
+            # Size the following chunks by what the first one actually took (measuring it is not cheap)
+            first_chunk = False
+            frame_bytes_per_byte = chunk.memory_usage(deep=True).sum() / cut
+            chunk_bytes = max(1024, int(max_memory_mb * 1024 ** 2 / frame_bytes_per_byte))
+        yield chunk
+    if pending_size:
+        yield parse_pageviews(pending)
+
+def iter_gzip_blocks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # Incrementally inflate a (possibly multi-member) gzip stream; blocks end anywhere, not on line breaks
+    decompressor = fast_zlib.decompressobj(fast_zlib.MAX_WBITS | 16)
+    in_member = False
+    for chunk in chunks:
+        while chunk:
+            try:
+                data = decompressor.decompress(chunk)
+            except fast_zlib.error as e:
+                raise zlib.error(str(e)) from e
+            chunk = b''
+            in_member = True
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = fast_zlib.decompressobj(fast_zlib.MAX_WBITS | 16)
+                in_member = False
+            if data:
+                yield data
+    if in_member:
+        raise zlib.error('Truncated gzip stream')
+
+def is_gzip_member_start(data: bytes, offset: int) -> bool:
+    header = data[offset:offset + 10]
+    if len(header) < 10 or header[:3] != GZIP_MEMBER_MAGIC or header[3] & 0xe0:
+        return False # Reserved flag bits are always zero
+    try:
+        fast_zlib.decompressobj(fast_zlib.MAX_WBITS | 16).decompress(data[offset:offset + GZIP_PROBE_BYTES])
+    except fast_zlib.error:
+        return False
+    return True
+
+def gzip_member_offsets(data: bytes, segment_count: int) -> list:
+    # Member starts close to segment_count evenly spaced offsets, found by scanning for the gzip magic.
+    # Magic bytes inside compressed data are mostly ruled out by is_gzip_member_start; the rare one that
+    # is not makes the segment before it fail to end on a member boundary. A single-member file yields [0].
+    offsets = [0]
+    step = max(len(data) // segment_count, 1)
+    for target in range(step, len(data), step):
+        offset = data.find(GZIP_MEMBER_MAGIC, max(target, offsets[-1] + 1))
+        while offset != -1 and not is_gzip_member_start(data, offset):
+            offset = data.find(GZIP_MEMBER_MAGIC, offset + 1)
+        if offset == -1:
+            break
+        offsets.append(offset)
+    return offsets
+
+def iter_gzip_blocks_parallel(chunks: Iterable[bytes], workers: int) -> Iterator[bytes]:
+    # Multi-member gzip files, e.g. concatenated or block-compressed (BGZF) ones, are split at member
+    # boundaries and the pieces inflated on worker threads; zlib, isal and zlib-ng release the GIL while
+    # inflating. Blocks come out in file order, with at most `workers` pieces in flight. The first piece
+    # starts at offset 0, so each one that inflates to exactly its end proves the next start is a real
+    # member; when one does not, the rest of the file is inflated serially from that piece's start.
+    data = b''.join(chunks)
+    offsets = gzip_member_offsets(data, max(workers, len(data) // PARALLEL_INFLATE_SEGMENT_BYTES))
+    if len(offsets) == 1:
+        yield from iter_gzip_blocks(split_chunks(data))
+        return
+
+    view = memoryview(data)
+    segments = list(zip(offsets, offsets[1:] + [len(data)]))
+
+    def inflate(start: int, end: int) -> list:
+        return list(iter_gzip_blocks(split_chunks(view[start:end])))
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = deque()
+        for segment in segments[:workers]:
+            pending.append((segment[0], pool.submit(inflate, *segment)))
+        next_segment = workers
+        while pending:
+            start, future = pending.popleft()
+            try:
+                blocks = future.result()
+            except zlib.error:
+                for _, other in pending:
+                    other.cancel()
+                logging.debug(f'No gzip member starts where expected after offset {start}, inflating the rest serially.')
+                yield from iter_gzip_blocks(split_chunks(view[start:]))
+                return
+            if next_segment < len(segments):
+                pending.append((segments[next_segment][0], pool.submit(inflate, *segments[next_segment])))
+                next_segment += 1
+            yield from blocks
+
+def iter_bz2_blocks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # Same as iter_gzip_blocks for (possibly multi-stream) bz2
+    decompressor = bz2.BZ2Decompressor()
+    in_stream = False
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            chunk = b''
+            in_stream = True
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = bz2.BZ2Decompressor()
+                in_stream = False
+            if data:
+                yield data
+    if in_stream:
+        raise OSError('Truncated bz2 stream')
+
+def parse_hourly_counts(encoded: bytes) -> dict:
+    # 'A3C12' -> {0: 3, 2: 12}; hours without views are left out
+    return {letter[0] - ord('A'): int(count) for letter, count in HOURLY_COUNTS_PATTERN.findall(encoded)}
+
+def daily_domain_code(wiki_code: bytes, access: bytes) -> bytes:
+    # 'en.wikipedia' is 'en' in hour files when read on desktop and 'en.m' on mobile web or app,
+    # 'de.wiktionary' is 'de.d' or 'de.m.d'; unknown projects keep their name as the suffix
+    language, _, project = wiki_code.partition(b'.')
+    suffix = DAILY_PROJECT_SUFFIXES.get(project, b'.' + project if project else b'')
+    return language + (b'.m' if access.startswith(b'mobile') else b'') + suffix
+
+def iter_daily_blocks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    # Rewrites pageview-complete lines, 'wiki_code page_title page_id access_method daily_total hourly_counts',
+    # as hour-file lines holding the day's total, so daily files go through the same scan engines
+    domain_codes = {}
+    for lines in iter_line_batches(blocks):
+        out = []
+        for line in lines:
+            fields = line.rstrip(b'\r').split(b' ')
+            if len(fields) != 6:
+                continue
+            domain_key = (fields[0], fields[3])
+            domain_code = domain_codes.get(domain_key)
+            if domain_code is None:
+                domain_code = domain_codes[domain_key] = daily_domain_code(fields[0], fields[3])
+            daily_total = fields[4]
+            if not daily_total.isdigit():
+                daily_total = b'%d' % sum(parse_hourly_counts(fields[5]).values())
+            out.append(b'%s %s %s 0' % (domain_code, fields[1], daily_total))
+        if out:
+            out.append(b'')
+            yield b'\n'.join(out)
+
+def iter_dump_blocks(chunks: Iterable[bytes], inflate_workers: int = 1) -> Iterator[bytes]:
+    # Decompressed hour-file lines from either source; hour files are gzip and daily files bz2,
+    # so the first bytes tell them apart. More than one inflate worker reads the whole file first.
+    iterator = iter(chunks)
+    head = b''
+    for chunk in iterator:
+        head += bytes(chunk)
+        if len(head) >= len(DailySource.magic):
+            break
+    source = DailySource if head.startswith(DailySource.magic) else HourlySource
+    yield from source.iter_blocks(chain([head], iterator), inflate_workers)
+
+def iter_line_batches(blocks: Iterable[bytes]) -> Iterator[list]:
+    # The complete lines of each block, carrying a trailing partial line over to the next one
+    pending = b''
+    for data in blocks:
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        yield lines
+    if pending:
+        yield [pending]
+
+def iter_lines(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    for lines in iter_line_batches(blocks):
+        yield from lines
+
+def iter_gzip_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    return iter_lines(iter_gzip_blocks(chunks))
+
+def timed_blocks(blocks: Iterable[bytes], stats: dict, stage: str, count_lines: bool = False) -> Iterator[bytes]:
+    # Charges the time spent producing each block to stats[stage + '_seconds'], so a consumer's own
+    # time can be told apart from its input's
+    stats.setdefault(f'{stage}_seconds', 0.0)
+    stats.setdefault(f'{stage}_bytes', 0)
+    if count_lines:
+        stats.setdefault('lines', 0)
+    iterator = iter(blocks)
+    while True:
+        started = time.perf_counter()
+        block = next(iterator, None)
+        stats[f'{stage}_seconds'] += time.perf_counter() - started
+        if block is None:
+            return
+        stats[f'{stage}_bytes'] += len(block)
+        if count_lines:
+            stats['lines'] += block.count(b'\n')
+        yield block
+
+def split_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    view = memoryview(data)
+    return (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
+
+def parse_count(value: bytes) -> Optional[float]:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            count = float(value)
+        except ValueError:
+            return None
+        return None if count != count else count # NaN is dropped like pd.to_numeric + dropna
+
+def normalize_title(title: str) -> str:
+    # 'Elden Ring', 'elden_ring' and 'Elden%20Ring' all become 'elden ring'
+    return ' '.join(unquote(title).replace('_', ' ').split()).casefold()
+
+def fold_ascii_title(raw_title: bytes) -> Optional[str]:
+    # normalize_title done on the bytes, for the common printable-ASCII title without percent-encoding.
+    # Anything else (None) needs the full decode and unquote.
+    if len(raw_title.translate(None, FOLD_UNSAFE_BYTES)) != len(raw_title):
+        return None
+    return b' '.join(raw_title.replace(b'_', b' ').split()).lower().decode('ascii')
+
+def encode_domains(domains: Optional[Iterable[str]]) -> Optional[frozenset]:
+    return frozenset(domain.encode('utf-8') for domain in domains) if domains else None
+
+def finish_views(domain_views: dict, by_domain: bool) -> dict:
+    if by_domain:
+        return {term: {domain: int(views) for domain, views in views_by_domain.items()}
+                for term, views_by_domain in domain_views.items()}
+    return {term: int(sum(views_by_domain.values())) for term, views_by_domain in domain_views.items()}
+
+def add_line_views(domain_views: dict, term: str, fields: list) -> None:
+    count = parse_count(fields[2])
+    if count is not None:
+        domain = fields[0].decode('utf-8', 'replace')
+        domain_views[term][domain] = domain_views[term].get(domain, 0) + count
+
+def count_terms_in_lines(lines: Iterable[bytes], search_terms: Iterable[str], domains: Optional[Iterable[str]] = None,
+                         by_domain: bool = False, match: str = 'exact') -> dict:
+    # Raw title -> matched terms is one hash probe per line however many terms there are. For normalized
+    # matches that is the matcher's memo, and only titles it has not seen yet go through the matcher.
+    search_terms = list(search_terms)
+    matcher = get_title_matcher(tuple(search_terms), match) if match != 'exact' else None
+    known_titles = matcher.memo if matcher is not None else {term.encode('utf-8'): (term,) for term in search_terms}
+    domain_filter = encode_domains(domains)
+    domain_views = {term: {} for term in search_terms}
+    for line in lines:
+        fields = line.rstrip(b'\r').split(b' ')
+        # Mirror pd.read_csv(on_bad_lines='skip'): extra fields are skipped, missing ones are NaN
+        if len(fields) < 3 or len(fields) > 4:
+            continue
+        if domain_filter is not None and fields[0] not in domain_filter:
+            continue
+        terms = known_titles.get(fields[1])
+        if terms is None and matcher is not None:
+            terms = matcher(fields[1])
+        if terms:
+            for term in terms:
+                add_line_views(domain_views, term, fields)
+    return finish_views(domain_views, by_domain)
+
+def count_terms_in_blocks(blocks: Iterable[bytes], search_terms: Iterable[str], domains: Optional[Iterable[str]] = None,
+                          by_domain: bool = False) -> dict:
+    # Find ' title ' with bytes.find over whole decompressed blocks and only split the lines that
+    # contain it. This skips the per-line work entirely for the usual case of a few search terms.
+    wanted = {term.encode('utf-8'): term for term in search_terms}
+    domain_filter = encode_domains(domains)
+    needles = [(b' ' + encoded + b' ', encoded, term) for encoded, term in wanted.items()]
+    domain_views = {term: {} for term in wanted.values()}
+    pending = b''
+    for data in blocks:
+        cut = data.rfind(b'\n') + 1
+        if not cut:
+            pending += data
+            continue
+        text = pending + data[:cut]
+        pending = data[cut:]
+        for needle, encoded, term in needles:
+            position = text.find(needle)
+            while position != -1:
+                line_start = text.rfind(b'\n', 0, position) + 1
+                line_end = text.find(b'\n', position)
+                fields = text[line_start:line_end].rstrip(b'\r').split(b' ')
+                if 3 <= len(fields) <= 4 and fields[1] == encoded and (domain_filter is None or fields[0] in domain_filter):
+                    add_line_views(domain_views, term, fields)
+                position = text.find(needle, line_end)
+    if pending:
+        tail_views = count_terms_in_lines([pending], wanted.values(), domains, by_domain=True)
+        for term, views_by_domain in tail_views.items():
+            for domain, views in views_by_domain.items():
+                domain_views[term][domain] = domain_views[term].get(domain, 0) + views
+    return finish_views(domain_views, by_domain)
+
+def count_terms_with_pandas(blocks: Iterable[bytes], search_terms: Iterable[str], domains: Optional[Iterable[str]] = None,
+                            by_domain: bool = False, match: str = 'exact',
+                            max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    # Reference implementation with the same parsing rules as search_file, kept for comparison.
+    # The hour is read in chunks of about max_memory_mb and the partial sums are added up.
+    search_terms = list(search_terms)
+    domain_views = {term: {} for term in search_terms}
+    matcher = get_title_matcher(tuple(search_terms), match) if match != 'exact' else None
+    for chunk in read_pageview_chunks(blocks, max_memory_mb):
+        if matcher is None:
+            matched = chunk[chunk['Page Title'].isin(search_terms)].assign(Term=lambda df: df['Page Title'])
+        else:
+            # Match each distinct title once, then give every row its (possibly several) terms
+            titles = chunk['Page Title'].astype(str)
+            terms_by_title = {title: matcher(title.encode('utf-8')) for title in titles.unique()}
+            matched = chunk.assign(Term=titles.map(terms_by_title)).explode('Term').dropna(subset=['Term'])
+        if domains:
+            matched = matched[matched['Domain Code'].isin(list(domains))]
+        grouped = matched.groupby(['Term', 'Domain Code'], observed=True)['Count Views'].sum()
+        for (term, domain), views in grouped.items():
+            domain_views[term][domain] = domain_views[term].get(domain, 0) + int(views)
+    return finish_views(domain_views, by_domain)
+
+def count_title_views(lines: Iterable[bytes], domains: Optional[Iterable[str]] = None,
+                      capacity: Optional[int] = None) -> TopTitles:
+    top_titles = TopTitles(capacity)
+    domain_filter = encode_domains(domains)
+    counts = top_titles.counts
+    prune_at = 2 * capacity if capacity is not None else None
+    for line in lines:
+        fields = line.rstrip(b'\r').split(b' ')
+        if len(fields) < 3 or len(fields) > 4:
+            continue
+        if domain_filter is not None and fields[0] not in domain_filter:
+            continue
+        title = fields[1]
+        # '-' collects views the dumps could not attribute to a page, and special pages are not articles
+        if title == b'-' or title.startswith(b'Special:'):
+            continue
+        count = parse_count(fields[2])
+        if count is not None:
+            counts[title] = counts.get(title, 0) + count
+            if prune_at is not None and len(counts) > prune_at:
+                top_titles.prune()
+                counts = top_titles.counts
+    return top_titles
+
+def scan_blocks(blocks: Iterable[bytes], search_terms: Iterable[str], engine: str = 'bytes',
+                domains: Optional[Iterable[str]] = None, by_domain: bool = False, match: str = 'exact',
+                max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    search_terms = list(search_terms)
+    if match not in MATCH_MODES:
+        raise ValueError(f'Unknown match mode: {match}')
+    if engine == 'pandas':
+        return count_terms_with_pandas(blocks, search_terms, domains, by_domain, match, max_memory_mb)
+    if engine != 'bytes':
+        raise ValueError(f'Unknown scan engine: {engine}')
+    # Each term costs one pass of bytes.find, so large term lists are cheaper with one hash probe per line.
+    # Normalized variants of a title can't be found by searching for its bytes at all.
+    if match == 'exact' and len(search_terms) <= PREFILTER_MAX_TERMS:
+        return count_terms_in_blocks(blocks, search_terms, domains, by_domain)
+    return count_terms_in_lines(iter_lines(blocks), search_terms, domains, by_domain, match)
+
+def merge_views(total_searches: dict, hourly_views: dict) -> dict:
+    # Adds term -> views or term -> {domain: views} results
+    merged = dict(total_searches)
+    for key, views in hourly_views.items():
+        if isinstance(views, dict):
+            merged[key] = merge_views(merged.get(key, {}), views)
+        else:
+            merged[key] = merged.get(key, 0) + views
+    return merged
+
+def collapse_domains(total_searches: dict) -> dict:
+    return {term: sum(views.values()) if isinstance(views, dict) else views for term, views in total_searches.items()}
+
+def count_term_in_lines(lines: Iterable[bytes], searching_term: str) -> int:
+    return count_terms_in_lines(lines, [searching_term])[searching_term]
+
+def load_search_terms(terms: Optional[list] = None, terms_file: Optional[str] = None) -> list:
+    search_terms = list(terms or [])
+    if terms_file:
+        try:
+            with open(terms_file, 'r', encoding='utf-8') as file_in:
+                for line in file_in:
+                    term = line.strip()
+                    if term and not term.startswith('#'):
+                        search_terms.append(term)
+        except IOError as e:
+            logging.error(f'Error reading search terms from {terms_file}: {e}')
+            raise
+    return list(dict.fromkeys(search_terms)) # Drop duplicates, keep order
+
+def parse_hour(link: str) -> datetime:
+    return datetime.strptime(link.split('/')[-1].strip(), 'pageviews-%Y%m%d-%H%M%S.gz')
+
+def hour_index_name(link: str) -> str:
+    filename = link.split('/')[-1].strip()
+    return filename[:-3] if filename.endswith('.gz') else filename
+
+def write_hour_index(lines: Iterable[bytes], index_path: str) -> int:
+    title_views = {}
+    for line in lines:
+        fields = line.rstrip(b'\r').split(b' ')
+        if len(fields) < 3 or len(fields) > 4:
+            continue
+        count = parse_count(fields[2])
+        if count is not None:
+            title_views[fields[1]] = title_views.get(fields[1], 0) + count
+
+    titles = sorted(title_views)
+    offsets = np.zeros(len(titles) + 1, dtype=np.int64)
+    np.cumsum([len(title) for title in titles], out=offsets[1:])
+    views = np.array([int(title_views[title]) for title in titles], dtype=np.int64)
+
+    # Build next to the final location and swap it in, so a crash never leaves a half-written index
+    tmp_path = index_path + '.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'titles.npy'), np.frombuffer(b''.join(titles), dtype=np.uint8))
+    np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+    np.save(os.path.join(tmp_path, 'views.npy'), views)
+    if os.path.isdir(index_path):
+        shutil.rmtree(index_path)
+    os.replace(tmp_path, index_path)
+    return len(titles)
+
+def ingest_hour_file(link: str, search_url: str, index_dir: str, cache: Optional[DumpCache] = None,
+                     client: Optional[DownloadClient] = None) -> bool:
+    index_path = os.path.join(index_dir, hour_index_name(link))
+    if os.path.isdir(index_path):
+        logging.info(f'{hour_index_name(link)} is already indexed, skipping.')
+        return True
+    try:
+        data = fetch_hour_file(link, search_url, cache, client)
+        title_count = write_hour_index(iter_gzip_lines(split_chunks(data)), index_path)
+    except requests.exceptions.RequestException as e:
+        logging.error(f'Error downloading {urljoin(search_url, link.strip())}: {e}')
+        return False
+    except (zlib.error, OSError) as e:
+        logging.error(f'Error indexing {link.strip()}: {e}')
+        return False
+    logging.info(f'Indexed {title_count} titles from {link.strip()}.')
+    return True
+
+def count_terms_from_index(links: list, search_terms: list, index_dir: str, result: Optional[SearchResult] = None,
+                           match: str = 'exact') -> tuple:
+    total_searches = dict.fromkeys(search_terms, 0)
+    matcher = get_title_matcher(tuple(search_terms), match) if match != 'exact' else None
+    missing_links = []
+    for link in links:
+        index_path = os.path.join(index_dir, hour_index_name(link))
+        if not os.path.isdir(index_path):
+            missing_links.append(link)
+            continue
+        hour_index = HourIndex(index_path)
+        if matcher is None:
+            hourly_views = {term: hour_index.lookup(term) for term in search_terms}
+        else:
+            hourly_views = hour_index.match_views(matcher)
+        total_searches = merge_views(total_searches, hourly_views)
+        if result is not None:
+            result.record(link, hourly_views)
+    logging.info(f'Answered {len(links) - len(missing_links)} hour(s) from the index in {index_dir}.')
+    return total_searches, missing_links
+
 def delete_searched_files(file_paths: list) -> None:
     for file_path in file_paths:
         try:
@@ -191,7 +1715,7 @@ def delete_searched_files(file_paths: list) -> None:
 def download_and_process_file(link: str, search_url: str, search_term: str, total_searches: int) -> int:
     filename_raw = link.split('/')[-1]
     filename = filename_raw.strip() # Remove any trailing newlines or spaces
-    full_download_url = search_url + link.strip()
+    full_download_url = urljoin(search_url, link.strip())
 
     logging.info(f'Downloading {filename} from {full_download_url}')
     try:
@@ -215,57 +1739,663 @@ def download_and_process_file(link: str, search_url: str, search_term: str, tota
         delete_searched_files([filename, unzipped_file_path]) # Clean up if unzipping or searching failed
         return total_searches
 
-def main():
+def iter_download(url: str, client: Optional[DownloadClient] = None) -> Iterator[bytes]:
+    if client is not None:
+        yield from client.iter_chunks(url)
+        return
+    with requests.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+
+def stream_and_process_terms(link: str, search_url: str, search_terms: list, total_searches: dict,
+                             cache: Optional[DumpCache] = None, engine: str = 'bytes',
+                             domains: Optional[list] = None, by_domain: bool = False,
+                             result: Optional[SearchResult] = None, client: Optional[DownloadClient] = None,
+                             metrics: Optional[RunMetrics] = None, match: str = 'exact', inflate_workers: int = 1,
+                             max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    filename = link.split('/')[-1].strip()
+    full_download_url = urljoin(search_url, link.strip())
+
+    try:
+        if cache is not None:
+            # The cache needs the whole compressed file anyway, so scan it from memory
+            data = fetch_hour_file(link, search_url, cache, client, metrics)
+            hourly_views, stats = scan_hour_data_timed(data, tuple(search_terms), engine, domains, by_domain, match,
+                                                       inflate_workers, max_memory_mb)
+        else:
+            logging.info(f'Streaming {filename} from {full_download_url}')
+            hourly_views, stats = scan_chunks_timed(iter_download(full_download_url, client), search_terms, engine,
+                                                    domains, by_domain, match, inflate_workers, max_memory_mb)
+            stats['streamed'] = True
+    except requests.exceptions.RequestException as e:
+        logging.error(f'Error downloading {full_download_url}: {e}')
+        return total_searches
+    except (zlib.error, OSError) as e:
+        logging.error(f'Error decompressing {filename}: {e}')
+        return total_searches
+
+    if metrics is not None:
+        metrics.record_scan(link, stats)
+    new_total_searches = merge_views(total_searches, hourly_views)
+    if result is not None:
+        result.record(link, hourly_views)
+    logging.info(f'{len(search_terms)} search term(s) matched {sum(collapse_domains(hourly_views).values())} views this hour.')
+    return new_total_searches
+
+def stream_and_process_file(link: str, search_url: str, search_term: str, total_searches: int) -> int:
+    new_total_searches = stream_and_process_terms(link, search_url, [search_term], {search_term: total_searches})[search_term]
+    logging.info(f'"{search_term}" has a total of {new_total_searches} searches so far.')
+    return new_total_searches
+
+def fetch_hour_file(link: str, search_url: str, cache: Optional[DumpCache] = None,
+                    client: Optional[DownloadClient] = None, metrics: Optional[RunMetrics] = None) -> bytes:
+    filename = link.split('/')[-1].strip()
+    full_download_url = urljoin(search_url, link.strip())
+    if cache is not None:
+        data = cache.get(filename)
+        if data is not None:
+            logging.info(f'Using cached copy of {filename}')
+            if metrics is not None:
+                metrics.add('cache_hit', link=link, bytes=len(data))
+            return data
+    logging.info(f'Fetching {full_download_url}')
+    started = time.perf_counter()
+    data = b''.join(iter_download(full_download_url, client))
+    if metrics is not None:
+        metrics.add('download', time.perf_counter() - started, link, bytes=len(data))
+    if cache is not None:
+        cache.put(filename, data)
+    return data
+
+def scan_hour_data(data: bytes, search_terms: tuple, engine: str = 'bytes', domains: Optional[list] = None,
+                   by_domain: bool = False, match: str = 'exact', inflate_workers: int = 1,
+                   max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    return scan_blocks(iter_dump_blocks(split_chunks(data), inflate_workers), search_terms, engine, domains, by_domain, match,
+                       max_memory_mb)
+
+def timed_scan(chunks: Iterable[bytes], scan: Callable[[Iterator[bytes]], object], inflate_workers: int = 1) -> tuple:
+    stats = {}
+    started = time.perf_counter()
+    blocks = timed_blocks(iter_dump_blocks(timed_blocks(chunks, stats, 'download'), inflate_workers), stats, 'inflate',
+                          count_lines=True)
+    scanned = scan(blocks)
+    stats['total_seconds'] = time.perf_counter() - started
+    return scanned, stats
+
+def scan_chunks_timed(chunks: Iterable[bytes], search_terms: tuple, engine: str = 'bytes',
+                      domains: Optional[list] = None, by_domain: bool = False, match: str = 'exact',
+                      inflate_workers: int = 1, max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> tuple:
+    return timed_scan(chunks, lambda blocks: scan_blocks(blocks, search_terms, engine, domains, by_domain, match,
+                                                         max_memory_mb),
+                      inflate_workers)
+
+def scan_hour_data_timed(data: bytes, search_terms: tuple, engine: str = 'bytes', domains: Optional[list] = None,
+                         by_domain: bool = False, match: str = 'exact', inflate_workers: int = 1,
+                         max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB,
+                         queued_at: Optional[float] = None) -> tuple:
+    # Runs in a scan process, so the time since queued_at is how long the hour waited for a free one
+    queued_seconds = time.time() - queued_at if queued_at is not None else None
+    hourly_views, stats = scan_chunks_timed(split_chunks(data), search_terms, engine, domains, by_domain, match,
+                                            inflate_workers, max_memory_mb)
+    stats['queued_seconds'] = queued_seconds
+    return hourly_views, stats
+
+def scan_hour_top_titles(data: bytes, domains: Optional[list] = None, capacity: Optional[int] = None,
+                         inflate_workers: int = 1, queued_at: Optional[float] = None) -> tuple:
+    queued_seconds = time.time() - queued_at if queued_at is not None else None
+    top_titles, stats = timed_scan(split_chunks(data), lambda blocks: count_title_views(iter_lines(blocks), domains, capacity),
+                                   inflate_workers)
+    stats['queued_seconds'] = queued_seconds
+    return top_titles, stats
+
+def iter_scanned_hours(links: list, search_url: str, scan: Callable, scan_args: tuple,
+                       fetch_workers: int = DEFAULT_FETCH_WORKERS, scan_workers: int = DEFAULT_SCAN_WORKERS,
+                       max_pending: Optional[int] = None, cache: Optional[DumpCache] = None,
+                       client: Optional[DownloadClient] = None, metrics: Optional[RunMetrics] = None) -> Iterator[tuple]:
+    # Downloads hour files on fetch_workers threads and runs scan(data, *scan_args) on each, in one of
+    # scan_workers processes or in the download thread when there are none. With metrics, scan also gets
+    # the time the hour was queued. Yields (link, scan result) in link order, so totals match a serial
+    # loop; hours that fail to download or decompress are logged and skipped.
+    # Each hour holds a whole compressed file or its scan result until it is consumed, so only max_pending
+    # hours may be in flight at a time.
+    max_pending = max_pending or fetch_workers + max(scan_workers, 1)
+    scan_pool = ProcessPoolExecutor(scan_workers) if scan_workers > 0 else None
+
+    def fetch_and_submit(link: str) -> Future:
+        data = fetch_hour_file(link, search_url, cache, client, metrics)
+        queued = (time.time(),) if metrics is not None else ()
+        if scan_pool is None:
+            scan_future = Future()
+            try:
+                scan_future.set_result(scan(data, *scan_args, *queued))
+            except Exception as e:
+                scan_future.set_exception(e)
+            return scan_future
+        return scan_pool.submit(scan, data, *scan_args, *queued)
+
+    def consume(link: str, fetch_future: Future):
+        try:
+            return fetch_future.result().result()
+        except requests.exceptions.RequestException as e:
+            logging.error(f'Error downloading {urljoin(search_url, link.strip())}: {e}')
+        except (zlib.error, OSError) as e:
+            logging.error(f'Error decompressing {link.strip()}: {e}')
+        return None
+
+    try:
+        with ThreadPoolExecutor(fetch_workers) as fetch_pool:
+            pending = deque()
+            for link in links:
+                if len(pending) >= max_pending:
+                    started = time.perf_counter()
+                    done_link, fetch_future = pending.popleft()
+                    scanned = consume(done_link, fetch_future)
+                    if metrics is not None:
+                        metrics.add('fetch_queue_wait', time.perf_counter() - started)
+                    if scanned is not None:
+                        yield done_link, scanned
+                pending.append((link, fetch_pool.submit(fetch_and_submit, link)))
+            while pending:
+                done_link, fetch_future = pending.popleft()
+                scanned = consume(done_link, fetch_future)
+                if scanned is not None:
+                    yield done_link, scanned
+    finally:
+        if scan_pool is not None:
+            scan_pool.shutdown()
+
+def run_pipeline(links: list, search_url: str, search_terms: list, fetch_workers: int = DEFAULT_FETCH_WORKERS,
+                 scan_workers: int = DEFAULT_SCAN_WORKERS, max_pending: Optional[int] = None,
+                 cache: Optional[DumpCache] = None, engine: str = 'bytes', domains: Optional[list] = None,
+                 by_domain: bool = False, result: Optional[SearchResult] = None,
+                 client: Optional[DownloadClient] = None, metrics: Optional[RunMetrics] = None,
+                 match: str = 'exact', inflate_workers: int = 1,
+                 max_memory_mb: Optional[float] = DEFAULT_PANDAS_MEMORY_MB) -> dict:
+    scan = scan_hour_data if metrics is None else scan_hour_data_timed
+    scan_args = (tuple(search_terms), engine, domains, by_domain, match, inflate_workers, max_memory_mb)
+    total_searches = {term: {} if by_domain else 0 for term in search_terms}
+    for link, hourly_views in iter_scanned_hours(links, search_url, scan, scan_args, fetch_workers, scan_workers,
+                                                 max_pending, cache, client, metrics):
+        if metrics is not None:
+            hourly_views, stats = hourly_views
+            metrics.record_scan(link, stats)
+        total_searches = merge_views(total_searches, hourly_views)
+        if result is not None:
+            result.record(link, hourly_views)
+        logging.info(f'{len(search_terms)} search term(s) matched {sum(collapse_domains(hourly_views).values())} views in {link.strip()}.')
+    return total_searches
+
+def run_top_titles(links: list, search_url: str, capacity: Optional[int] = DEFAULT_TOP_CAPACITY,
+                   fetch_workers: int = DEFAULT_FETCH_WORKERS, scan_workers: int = DEFAULT_SCAN_WORKERS,
+                   cache: Optional[DumpCache] = None, domains: Optional[list] = None,
+                   client: Optional[DownloadClient] = None, metrics: Optional[RunMetrics] = None,
+                   inflate_workers: int = 1) -> TopTitles:
+    # Each hour is summarized where it is scanned and only the summary travels back to be merged,
+    # so at most a few hour summaries exist next to the running one
+    top_titles = TopTitles(capacity)
+    for link, (hour_titles, stats) in iter_scanned_hours(links, search_url, scan_hour_top_titles, (domains, capacity, inflate_workers),
+                                                         max(fetch_workers, 1), scan_workers, None, cache, client, metrics):
+        if metrics is not None:
+            metrics.record_scan(link, stats)
+        top_titles.merge(hour_titles)
+        logging.info(f'Counted {len(hour_titles.counts)} title(s) in {link.strip()}, tracking {len(top_titles.counts)}.')
+    return top_titles
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Count Wikipedia page views for one or more page titles.')
+    parser.add_argument('--job-file', metavar='PATH',
+                        help='JSON or YAML file listing many (date range, terms) jobs to run unattended in one pass.')
+    parser.add_argument('--start', metavar='YYYY-MM-DD', help='First day of the search; may be in a different month or year than --end.')
+    parser.add_argument('--end', metavar='YYYY-MM-DD', help='Last day of the search (default: same as --start).')
+    parser.add_argument('--listing-workers', type=int, default=DEFAULT_LISTING_WORKERS, metavar='N',
+                        help='Monthly directory listings fetched in parallel, at most --max-connections.')
+    parser.add_argument('--listing-cache', metavar='PATH', help='JSON file caching parsed directory listings between runs.')
+    parser.add_argument('--source', choices=SOURCES, default='auto',
+                        help='Read hour files, or per-day pageview-complete files with 24x fewer downloads. auto (default) '
+                             'reads daily files unless per-hour results are needed, and hour files for days without one.')
+    parser.add_argument('--terms', nargs='+', metavar='TITLE', help='Page titles to count in a single pass over each hour file.')
+    parser.add_argument('--terms-file', metavar='PATH', help='File with one page title per line.')
+    parser.add_argument('--fetch-workers', type=int, default=1, metavar='N', help='Parallel downloads (default: 1, serial streaming).')
+    parser.add_argument('--scan-workers', type=int, default=0, metavar='N', help='Processes for decompressing and scanning (default: 0, scan in the download thread).')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS, metavar='N',
+                        help=f'Concurrent connections to the dumps server (default: {DEFAULT_MAX_CONNECTIONS}).')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES, metavar='N',
+                        help='Retries per hour file after a transient download error.')
+    parser.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE, metavar='BYTES', help='Download chunk size.')
+    parser.add_argument('--rate-limit', type=float, metavar='MB_PER_S', help='Cap on the combined download rate.')
+    parser.add_argument('--cache-dir', metavar='PATH', help='Keep downloaded hour files in this directory and reuse them on later runs.')
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_CACHE_MAX_BYTES / 1024 ** 3, metavar='GB',
+                        help='Size budget of the dump cache; least recently used files are evicted first.')
+    parser.add_argument('--inflate-workers', type=int, default=1, metavar='N',
+                        help='Threads inflating each multi-member gzip hour file; the file is read whole first (default: 1).')
+    parser.add_argument('--engine', choices=SCAN_ENGINES, default='bytes',
+                        help='Scanner for hour files: byte-level matcher (default) or the pandas reference implementation.')
+    parser.add_argument('--pandas-memory-mb', type=float, default=DEFAULT_PANDAS_MEMORY_MB, metavar='MB',
+                        help=f'Approximate size of each DataFrame chunk read by --engine pandas (default: {DEFAULT_PANDAS_MEMORY_MB}).')
+    parser.add_argument('--match', choices=MATCH_MODES, default='exact',
+                        help='How titles are compared: exactly (default), normalized (case, spaces/underscores and '
+                             'percent-encoding folded), as normalized prefixes, or as regexes on the normalized title.')
+    parser.add_argument('--domains', nargs='+', metavar='CODE', help='Only count these domain codes, e.g. en en.m.')
+    parser.add_argument('--by-domain', action='store_true', help='Also store a per-domain breakdown of the totals.')
+    parser.add_argument('--hourly', action='store_true', help='Also store per-hour totals for every search term.')
+    parser.add_argument('--export', metavar='PATH', help='Write per-hour totals to a .csv or .parquet file.')
+    parser.add_argument('--storage', choices=STORAGE_BACKENDS, default=STORAGE_BACKEND,
+                        help=f'Where results are stored (default: {STORAGE_BACKEND}, set STORAGE_BACKEND in config.py to change it).')
+    parser.add_argument('--storage-path', metavar='PATH', help='SQLite file or CSV/Parquet directory for the local backends.')
+    parser.add_argument('--db-batch-size', type=int, default=DEFAULT_DB_BATCH_SIZE, metavar='N',
+                        help='Rows buffered before they are written to the database.')
+    parser.add_argument('--db-flush-seconds', type=float, default=DEFAULT_DB_FLUSH_SECONDS, metavar='S',
+                        help='Longest time rows stay buffered before they are written.')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH, metavar='PATH',
+                        help=f'SQLite file that checkpoints finished hours (default: {DEFAULT_JOURNAL_PATH}).')
+    parser.add_argument('--no-journal', action='store_true', help='Do not checkpoint finished hours.')
+    parser.add_argument('--resume', action='store_true', help='Skip hours the journal already has for the same search.')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep running: poll for newly published hour files from --start (default: the first day of '
+                             'this month) on, count only those and update the stored totals after each poll.')
+    parser.add_argument('--follow-interval', type=float, default=DEFAULT_FOLLOW_INTERVAL, metavar='SECONDS',
+                        help=f'Time between polls in follow mode (default: {DEFAULT_FOLLOW_INTERVAL:.0f}).')
+    parser.add_argument('--top', type=int, metavar='N', help='Store the N most viewed titles of the date range instead of searching.')
+    parser.add_argument('--top-mode', choices=TOP_MODES, default='approximate',
+                        help='Count every title exactly, or keep a bounded summary of the largest counts (default).')
+    parser.add_argument('--top-capacity', type=int, default=DEFAULT_TOP_CAPACITY, metavar='N',
+                        help=f'Title counters kept in approximate mode (default: {DEFAULT_TOP_CAPACITY}).')
+    parser.add_argument('--ingest', metavar='INDEX_DIR', help='Build a per-hour title index for the date range instead of searching.')
+    parser.add_argument('--index-dir', metavar='INDEX_DIR', help='Answer searches from hour indexes built with --ingest where available.')
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write the run report, with per-stage and per-hour timings, as JSON.')
+    parser.add_argument('--metrics-prometheus', metavar='PATH', help='Write the run totals in Prometheus text format.')
+    parser.add_argument('--statsd', metavar='HOST:PORT', help='Send the run totals as StatsD gauges over UDP.')
+    args = parser.parse_args(argv)
+    # Listings are fetched before or between downloads, never alongside them, so capping their threads
+    # keeps every phase within --max-connections
+    args.listing_workers = max(1, min(args.listing_workers, args.max_connections))
+    return args
+
+def process_links(links: list, search_url: str, search_terms: list, total_searches: dict, args: argparse.Namespace,
+                  domains: Optional[list], by_domain: bool, recorder: HourRecorders, cache: Optional[DumpCache],
+                  client: DownloadClient, metrics: Optional[RunMetrics] = None) -> dict:
+    if args.fetch_workers > 1 or args.scan_workers > 0:
+        pipeline_totals = run_pipeline(links, search_url, search_terms, args.fetch_workers, args.scan_workers,
+                                       cache=cache, engine=args.engine, domains=domains, by_domain=by_domain,
+                                       result=recorder, client=client, metrics=metrics, match=args.match,
+                                       inflate_workers=args.inflate_workers, max_memory_mb=args.pandas_memory_mb)
+        return merge_views(total_searches, pipeline_totals)
+    for link in links:
+        total_searches = stream_and_process_terms(link, search_url, search_terms, total_searches, cache, args.engine,
+                                                  domains, by_domain, recorder, client, metrics, args.match,
+                                                  args.inflate_workers, args.pandas_memory_mb)
+    return total_searches
+
+def write_text_atomically(path: str, text: str) -> None:
+    # Scrapers such as node_exporter's textfile collector may read the file at any moment
+    with open(path + '.tmp', 'w', encoding='utf-8') as file_out:
+        file_out.write(text)
+    os.replace(path + '.tmp', path)
+
+def export_metrics(metrics: RunMetrics, args: argparse.Namespace) -> None:
+    try:
+        if args.metrics_json:
+            write_text_atomically(args.metrics_json, json.dumps(metrics.summary(), indent=2))
+        if args.metrics_prometheus:
+            write_text_atomically(args.metrics_prometheus, metrics.prometheus_text())
+        if args.statsd:
+            metrics.send_statsd(args.statsd)
+    except (OSError, ValueError) as e:
+        logging.error(f'Failed to export run metrics: {e}')
+
+def report_metrics(metrics: RunMetrics, args: argparse.Namespace) -> None:
+    logging.info(f'Run summary: {json.dumps(metrics.summary(include_hours=False))}')
+    export_metrics(metrics, args)
+
+def search_top_titles(args: argparse.Namespace, links: list, search_url: str, search_dates_display: str) -> None:
+    capacity = max(args.top_capacity, args.top) if args.top_mode == 'approximate' else None
+    cache = DumpCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    client = DownloadClient(args.chunk_size, args.max_retries, max_connections=args.max_connections,
+                            rate_limit=args.rate_limit * 1024 ** 2 if args.rate_limit else None)
+    metrics = RunMetrics()
+    try:
+        top_titles = run_top_titles(links, search_url, capacity, args.fetch_workers, args.scan_workers, cache,
+                                    args.domains, client, metrics, args.inflate_workers)
+    except Exception as e:
+        logging.error(f'Error processing hour files: {e}')
+        return
+    finally:
+        client.log_stats()
+        client.close()
+        if cache is not None:
+            cache.log_stats()
+
+    top_views = top_titles.top(args.top)
+    if capacity is not None:
+        logging.info(f'Top {len(top_views)} title(s) found with {capacity} counters; counts may be low by up to {int(top_titles.max_error)} views.')
+    try:
+        with open_store(args.storage, args.storage_path, args.db_batch_size, args.db_flush_seconds) as database:
+            database.store_batch(top_views, search_dates_display)
+        metrics.add('store', database.write_seconds, rows=database.rows_written)
+    except Exception as e:
+        logging.error(f'Failed to store data in database: {e}')
+    report_metrics(metrics, args)
+
+def load_jobs(job_file: str) -> list:
+    try:
+        with open(job_file, 'r', encoding='utf-8') as file_in:
+            if job_file.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ValueError('PyYAML is needed for YAML job files, install it or use JSON.')
+                job_specs = yaml.safe_load(file_in)
+            else:
+                job_specs = json.load(file_in)
+        if isinstance(job_specs, dict):
+            job_specs = job_specs.get('jobs', [])
+
+        jobs = []
+        for number, spec in enumerate(job_specs, start=1):
+            start_date, end_date = validate_date_range(str(spec['start']), str(spec.get('end', spec['start'])))
+            search_terms = load_search_terms(spec.get('terms'), spec.get('terms_file'))
+            if not search_terms:
+                raise ValueError(f'Job {number} has no search terms.')
+            jobs.append(BatchJob(spec.get('name', f'job-{number}'), start_date, end_date, search_terms,
+                                 spec.get('domains'), spec.get('by_domain', False)))
+        return jobs
+    except (IOError, KeyError, TypeError, ValueError) as e:
+        logging.error(f'Invalid job file {job_file}: {e}')
+        raise
+
+def run_jobs(args: argparse.Namespace) -> None:
+    try:
+        jobs = load_jobs(args.job_file)
+    except (IOError, KeyError, TypeError, ValueError):
+        return
+
+    # Every hour file any job needs is fetched and scanned once, for all jobs' terms together,
+    # with a per-domain breakdown so each job can apply its own domain filter afterwards
+    search_span = sorted({day for job in jobs for day in job.search_dates})
+    search_terms = list(dict.fromkeys(term for job in jobs for term in job.search_terms))
+    domains = None if any(not job.domains for job in jobs) else sorted({domain for job in jobs for domain in job.domains})
+    logging.info(f'Running {len(jobs)} job(s): {len(search_terms)} distinct term(s) over {len(search_span)} distinct day(s).')
+
+    search_url = WIKIPEDIA_BASE_URL
+    try:
+        listing_cache = ListingCache(args.listing_cache) if args.listing_cache else None
+        links = fetch_source_links(args.source, search_span, args.listing_workers, listing_cache)
+        if listing_cache is not None:
+            listing_cache.save()
+    except Exception as e:
+        logging.error(f'Failed to initialize Wiki or fetch links: {e}')
+        return
+
+    cache = DumpCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    client = DownloadClient(args.chunk_size, args.max_retries, max_connections=args.max_connections,
+                            rate_limit=args.rate_limit * 1024 ** 2 if args.rate_limit else None)
+    metrics = RunMetrics()
+    try:
+        process_links(links, search_url, search_terms, {term: {} for term in search_terms}, args, domains, True,
+                      HourRecorders(*jobs), cache, client, metrics)
+    except Exception as e:
+        logging.error(f'Error processing hour files: {e}')
+        return
+    finally:
+        client.log_stats()
+        client.close()
+        if cache is not None:
+            cache.log_stats()
+
+    try:
+        with open_store(args.storage, args.storage_path, args.db_batch_size, args.db_flush_seconds) as database:
+            for job in jobs:
+                dates_display = display_search_dates(job.search_dates)
+                database.store_batch(collapse_domains(job.totals), dates_display)
+                if job.by_domain:
+                    database.store_domain_breakdown(job.totals, dates_display)
+                logging.info(f'Job "{job.name}" finished with {sum(collapse_domains(job.totals).values())} total views.')
+        metrics.add('store', database.write_seconds, rows=database.rows_written)
+    except Exception as e:
+        logging.error(f'Failed to store data in database: {e}')
+    report_metrics(metrics, args)
+
+class FollowedHours:
+    # Hour files a follow run has counted. It is a recorder, so an hour that fails to download is not
+    # marked and stays queued until a later poll counts it.
+    def __init__(self, hour_files: Iterable[str] = ()):
+        self.hour_files = set(hour_files)
+        self.queued = {} # Hour file name -> link, for listed hours not counted yet
+
+    def record(self, link: str, hourly_views: dict) -> None:
+        self.hour_files.add(link.split('/')[-1].strip())
+
+    def queue(self, links: list) -> list:
+        # After the backfill the older months are no longer listed, so a failed hour from them is only
+        # found again here
+        for link in links:
+            self.queued.setdefault(link.split('/')[-1].strip(), link)
+        self.queued = {name: link for name, link in self.queued.items() if name not in self.hour_files}
+        return sorted(self.queued.values(), key=link_sort_key)
+
+def follow_search(args: argparse.Namespace, search_terms: list, start_day: str, max_polls: Optional[int] = None) -> dict:
+    # Polls for newly published hour files and scans only those, so a poll costs what was published since
+    # the previous one. The running totals are upserted after every poll that changed them, keyed
+    # '<start_day> - now'. The journal remembers counted hours, so a restarted run picks up where it stopped.
+    search_url = WIKIPEDIA_BASE_URL
+    dates_display = f'{start_day} - now'
+    listing_cache = ListingCache(args.listing_cache)
+    cache = DumpCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    client = DownloadClient(args.chunk_size, args.max_retries, max_connections=args.max_connections,
+                            rate_limit=args.rate_limit * 1024 ** 2 if args.rate_limit else None)
+    metrics = RunMetrics()
+    total_searches = {term: {} if args.by_domain else 0 for term in search_terms}
+    followed = FollowedHours()
+    journal = None
+    unsaved_results = [] # Hourly rows wait here until a store succeeds
+    polls = 0
+    backfill = True
+    unsaved = False
+    try:
+        if not args.no_journal:
+            journal = CrawlJournal(args.journal, search_terms, args.domains, args.by_domain, args.match)
+            for hour_file, hourly_views in journal.completed_hours().items():
+                # Only hour files: a daily file from an earlier run would count its day twice
+                hour_match = DUMP_FILENAME_PATTERN.fullmatch(hour_file)
+                if hour_match and hour_match.group(1) >= start_day:
+                    total_searches = merge_views(total_searches, hourly_views)
+                    followed.record(hour_file, hourly_views)
+            logging.info(f'Following from {start_day}: {len(followed.hour_files)} hour(s) already counted in {args.journal}.')
+            unsaved = bool(followed.hour_files)
+
+        while True:
+            new_links, listed = poll_new_links(search_url, start_day, followed.hour_files, backfill,
+                                               args.listing_workers, listing_cache)
+            backfill = backfill and not listed
+            new_links = followed.queue(new_links)
+            if new_links:
+                logging.info(f'{len(new_links)} new hour file(s) to process.')
+                result = SearchResult.from_links(search_terms, new_links) if args.hourly else None
+                if result is not None:
+                    unsaved_results.append(result)
+                counted = len(followed.hour_files)
+                total_searches = process_links(new_links, search_url, search_terms, total_searches, args, args.domains,
+                                               args.by_domain, HourRecorders(result, journal, followed), cache, client, metrics)
+                unsaved = unsaved or len(followed.hour_files) > counted
+            if unsaved:
+                try:
+                    with open_store(args.storage, args.storage_path, args.db_batch_size, args.db_flush_seconds) as database:
+                        database.store_batch(collapse_domains(total_searches), dates_display)
+                        if args.by_domain:
+                            database.store_domain_breakdown(total_searches, dates_display)
+                        for result in unsaved_results:
+                            database.store_hourly(result)
+                    metrics.add('store', database.write_seconds, rows=database.rows_written)
+                    unsaved_results = []
+                    unsaved = False
+                except Exception as e:
+                    logging.error(f'Failed to store data in database, trying again on the next poll: {e}')
+            logging.info(f'{len(followed.hour_files)} hour(s) counted, {sum(collapse_domains(total_searches).values())} total views.')
+            # A follow run may never exit, so the exported metrics are refreshed every poll
+            export_metrics(metrics, args)
+
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            time.sleep(args.follow_interval)
+    except KeyboardInterrupt:
+        logging.info('Stopped following.')
+    finally:
+        client.log_stats()
+        client.close()
+        if cache is not None:
+            cache.log_stats()
+        if journal is not None:
+            journal.close()
+        listing_cache.save()
+    report_metrics(metrics, args)
+    return total_searches
+
+def run_follow(args: argparse.Namespace) -> None:
+    if args.top or args.ingest or args.export or args.index_dir:
+        logging.error('--follow cannot be combined with --top, --ingest, --export or --index-dir.')
+        return
+    try:
+        start_day = validate_date_range(args.start, args.start)[0].strftime('%Y%m%d') if args.start else f'{utc_today():%Y%m}01'
+        search_terms = load_search_terms(args.terms, args.terms_file)
+    except (IOError, ValueError):
+        return
+    if not search_terms:
+        logging.error('--follow runs unattended, pass the titles with --terms or --terms-file.')
+        return
+    follow_search(args, search_terms, start_day)
+
+def main(argv: Optional[list] = None):
+    args = parse_args(argv)
     logging.info('Starting Wikipedia data search script.')
+    if args.job_file:
+        run_jobs(args)
+        logging.info('Script finished.')
+        return
+    if args.follow:
+        run_follow(args)
+        logging.info('Script finished.')
+        return
     print('Wikipedia data is offered from year 2015'.upper())
 
     try:
-        year_input = input('Enter year for your search[YYYY]: ')
-        month_input = input('Enter month for your search[MM]: ')
-        start_day_input = input('Enter a day to start your search[DD]: ')
-        end_day_input = input('Enter a day to end your search[DD]: ')
+        if args.start:
+            start_date, end_date = validate_date_range(args.start, args.end or args.start)
+            search_span = get_date_range_span(start_date, end_date)
+        else:
+            year_input = input('Enter year for your search[YYYY]: ')
+            month_input = input('Enter month for your search[MM]: ')
+            start_day_input = input('Enter a day to start your search[DD]: ')
+            end_day_input = input('Enter a day to end your search[DD]: ')
 
-        year, month, start_day, end_day = validate_date_input(year_input, month_input, start_day_input, end_day_input)
+            year, month, start_day, end_day = validate_date_input(year_input, month_input, start_day_input, end_day_input)
+            search_span = get_search_span(year, month, start_day, end_day)
     except ValueError:
         logging.error('Exiting due to invalid date input.')
         return
 
-    search_span = get_search_span(year, month, start_day, end_day)
     search_dates_display = display_search_dates(search_span)
-    search_term = input('Enter word to search: ')
+    search_terms = []
+    if not args.ingest and not args.top:
+        try:
+            search_terms = load_search_terms(args.terms, args.terms_file)
+        except IOError:
+            return
+        if not search_terms:
+            search_terms = [input('Enter word to search: ')]
 
-    search_url = format_url(WIKIPEDIA_BASE_URL, str(year), f'{month:02d}')
+    # Daily files have no hours to record, export or index one by one
+    needs_hours = args.hourly or args.export or args.ingest or args.index_dir
+    if needs_hours and args.source == 'daily':
+        logging.error('--hourly, --export, --ingest and --index-dir need hour files, use --source hourly or auto.')
+        return
+    source = 'hourly' if needs_hours else args.source
 
+    search_url = WIKIPEDIA_BASE_URL
     try:
-        wiki = Wiki(search_url)
-        wiki.fetch_page()
-        all_links = wiki.find_all_links()
-        write_links_to_file(all_links, search_span, 'wiki_links.txt')
+        listing_cache = ListingCache(args.listing_cache) if args.listing_cache else None
+        links = fetch_source_links(source, search_span, args.listing_workers, listing_cache)
+        if listing_cache is not None:
+            listing_cache.save()
     except Exception as e:
         logging.error(f'Failed to initialize Wiki or fetch links: {e}')
         return
+    logging.info(f'Found {len(links)} dump file(s) to process.')
 
-    total_searches = 0
-    try:
-        with open('wiki_links.txt', 'r') as links_file:
-            for link in links_file:
-                if link.strip(): # Ensure link is not empty
-                    total_searches = download_and_process_file(link, search_url, search_term, total_searches)
-    except FileNotFoundError:
-        logging.error('wiki_links.txt not found. No files to process.')
+    if args.top:
+        search_top_titles(args, links, search_url, search_dates_display)
+        logging.info('Script finished.')
         return
+
+    cache = DumpCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    client = DownloadClient(args.chunk_size, args.max_retries, max_connections=args.max_connections,
+                            rate_limit=args.rate_limit * 1024 ** 2 if args.rate_limit else None)
+    total_searches = {term: {} if args.by_domain else 0 for term in search_terms}
+    result = None
+    journal = None
+    metrics = RunMetrics()
+    try:
+        if (args.hourly or args.export) and not args.ingest:
+            result = SearchResult.from_links(search_terms, links)
+        if not args.ingest and not args.no_journal:
+            journal = CrawlJournal(args.journal, search_terms, args.domains, args.by_domain, args.match)
+            if args.resume:
+                completed_hours = journal.completed_hours()
+                for link in links:
+                    hourly_views = completed_hours.get(link.split('/')[-1].strip())
+                    if hourly_views is not None:
+                        total_searches = merge_views(total_searches, hourly_views)
+                        if result is not None:
+                            result.record(link, hourly_views)
+                links = [link for link in links if link.split('/')[-1].strip() not in completed_hours]
+                logging.info(f'Resuming from {args.journal}: {len(completed_hours)} hour(s) already done, {len(links)} to go.')
+            else:
+                journal.reset()
+        recorder = HourRecorders(result, journal)
+        if args.ingest:
+            indexed = sum(ingest_hour_file(link, search_url, args.ingest, cache, client) for link in links)
+            logging.info(f'{indexed} of {len(links)} hour file(s) are indexed in {args.ingest}.')
+            links = []
+        elif args.index_dir and (args.domains or args.by_domain):
+            logging.warning('Hour indexes hold totals over all domains, ignoring --index-dir.')
+        elif args.index_dir:
+            index_totals, links = count_terms_from_index(links, search_terms, args.index_dir, recorder, args.match)
+            total_searches = merge_views(total_searches, index_totals)
+            if links:
+                logging.warning(f'{len(links)} hour file(s) are not indexed yet and will be downloaded.')
+        total_searches = process_links(links, search_url, search_terms, total_searches, args, args.domains, args.by_domain,
+                                       recorder, cache, client, metrics)
     except Exception as e:
-        logging.error(f'Error processing links from file: {e}')
+        logging.error(f'Error processing hour files: {e}')
         return
     finally:
-        delete_searched_files(['wiki_links.txt']) # Clean up the links file
+        client.log_stats()
+        client.close()
+        if cache is not None:
+            cache.log_stats()
+        if journal is not None:
+            journal.close()
+
+    if args.ingest:
+        logging.info('Script finished.')
+        return
+
+    if args.export:
+        try:
+            result.export(args.export)
+        except Exception as e:
+            logging.error(f'Failed to export hourly totals: {e}')
 
     try:
-        database = DataBase()
-        database.store_data(search_term, total_searches, search_dates_display)
+        with open_store(args.storage, args.storage_path, args.db_batch_size, args.db_flush_seconds) as database:
+            database.store_batch(collapse_domains(total_searches), search_dates_display)
+            if args.by_domain:
+                database.store_domain_breakdown(total_searches, search_dates_display)
+            if args.hourly:
+                database.store_hourly(result)
+        metrics.add('store', database.write_seconds, rows=database.rows_written)
     except Exception as e:
         logging.error(f'Failed to store data in database: {e}')
 
+    report_metrics(metrics, args)
     logging.info('Script finished.')
 
 if __name__ == '__main__':